@@ -0,0 +1,44 @@
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial, wraps
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections
+
+SAFE_METHODS = ('GET', 'HEAD')
+
+executor = ThreadPoolExecutor(max_workers=settings.ASYNC_ORM_WORKERS,
+                              thread_name_prefix='orm')
+
+
+def run_view(view, request, *args, **kwargs):
+    close_old_connections()
+    try:
+        response = view(request, *args, **kwargs)
+        if callable(getattr(response, 'render', None)):
+            response.render()
+        return response
+    finally:
+        close_old_connections()
+
+
+def async_view(view):
+    """Асинхронная обёртка над синхронным представлением DRF.
+
+    Под ASGI Django выполняет синхронные представления по очереди в одном
+    общем потоке. Обёрнутое представление вместе с запросами к ORM и
+    рендерингом уходит в пул из ASYNC_ORM_WORKERS потоков, поэтому
+    медленный запрос не задерживает остальные, а число одновременных
+    обращений к базе ограничено размером пула. В пул попадают только
+    GET и HEAD: записи выполняются в общем потоке, как без обёртки.
+    """
+    read = sync_to_async(partial(run_view, view), thread_sensitive=False,
+                         executor=executor)
+    write = sync_to_async(partial(run_view, view), thread_sensitive=True)
+
+    @wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        run = read if request.method in SAFE_METHODS else write
+        return await run(request, *args, **kwargs)
+
+    return wrapper
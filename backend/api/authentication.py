@@ -0,0 +1,127 @@
+import copy
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.translation import gettext_lazy as _
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.permissions import SAFE_METHODS
+
+SHARED_KEY = 'auth-token:{digest}'
+
+
+class TokenUserCache:
+    """Соответствие токен → пользователь в LRU процесса с TTL.
+
+    Вторым уровнем может служить общий кэш Django с алиасом
+    AUTH_TOKEN_SHARED_CACHE. Записи сбрасываются сигналами при выходе,
+    изменении и удалении пользователя; в других процессах локальная запись
+    живёт не дольше AUTH_TOKEN_CACHE_TTL.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._user_keys = {}
+
+    @staticmethod
+    def shared():
+        alias = settings.AUTH_TOKEN_SHARED_CACHE
+        return caches[alias] if alias else None
+
+    @staticmethod
+    def shared_key(key):
+        return SHARED_KEY.format(
+            digest=hashlib.sha256(key.encode()).hexdigest())
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] > time.monotonic():
+                self._entries.move_to_end(key)
+                return entry[0]
+        shared = self.shared()
+        user = shared.get(self.shared_key(key)) if shared else None
+        if user is not None:
+            self._remember(key, user)
+        return user
+
+    def set(self, key, user):
+        self._remember(key, user)
+        shared = self.shared()
+        if shared:
+            shared.set(self.shared_key(key), user,
+                       settings.AUTH_TOKEN_CACHE_TTL)
+
+    def _remember(self, key, user):
+        with self._lock:
+            self._drop(key)
+            self._entries[key] = (
+                user, time.monotonic() + settings.AUTH_TOKEN_CACHE_TTL)
+            self._user_keys.setdefault(user.pk, set()).add(key)
+            while len(self._entries) > settings.AUTH_TOKEN_CACHE_SIZE:
+                self._drop(next(iter(self._entries)))
+
+    def _drop(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            keys = self._user_keys.get(entry[0].pk, set())
+            keys.discard(key)
+            if not keys:
+                self._user_keys.pop(entry[0].pk, None)
+
+    def invalidate_token(self, key):
+        with self._lock:
+            self._drop(key)
+        shared = self.shared()
+        if shared:
+            shared.delete(self.shared_key(key))
+
+    def invalidate_user(self, user_id):
+        with self._lock:
+            keys = set(self._user_keys.get(user_id, ()))
+            for key in keys:
+                self._drop(key)
+        shared = self.shared()
+        if shared:
+            keys.update(Token.objects.filter(
+                user_id=user_id).values_list('key', flat=True))
+            shared.delete_many([self.shared_key(key) for key in keys])
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._user_keys.clear()
+
+
+token_cache = TokenUserCache()
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """TokenAuthentication, которая не ходит в базу для известных токенов.
+
+    Кэш используется только для чтения. Изменяющие запросы получают
+    пользователя из базы, потому что djoser сохраняет его целиком, и
+    устаревшая копия из кэша затёрла бы свежие данные.
+    """
+    use_cache = True
+
+    def authenticate(self, request):
+        self.use_cache = request.method in SAFE_METHODS
+        return super().authenticate(request)
+
+    def authenticate_credentials(self, key):
+        user = token_cache.get(key) if self.use_cache else None
+        if user is None:
+            user, token = super().authenticate_credentials(key)
+            token_cache.set(key, user)
+            return user, token
+        if not user.is_active:
+            raise AuthenticationFailed(_('User inactive or deleted.'))
+        user = copy.copy(user)
+        return user, Token(key=key, user=user)
@@ -0,0 +1,47 @@
+from django.db.models import Exists, OuterRef
+from rest_framework.response import Response
+
+from .serializers import BatchIdsSerializer
+
+
+def batch_ids(request):
+    serializer = BatchIdsSerializer(data=request.data)
+    serializer.is_valid(raise_exception=True)
+    return serializer.validated_data['ids']
+
+
+def link_status(targets, links, target_field, ids):
+    """{id: есть ли связь в links} для найденных объектов одним запросом"""
+    linked = Exists(links.filter(**{target_field: OuterRef('pk')}))
+    return dict(targets.filter(pk__in=ids).annotate(
+        linked=linked).values_list('pk', 'linked'))
+
+
+def batch_response(request, ids, linked, add, remove, invalid=()):
+    """Применить пакет одним INSERT или DELETE и вернуть исход по каждому id.
+
+    created/exists для POST, deleted/missing для DELETE, not_found для
+    несуществующих объектов и invalid для недопустимых.
+    """
+    if request.method == 'POST':
+        changed = [pk for pk in ids
+                   if linked.get(pk) is False and pk not in invalid]
+        outcomes = {True: 'exists', False: 'created'}
+        apply = add
+    else:
+        invalid = ()
+        changed = [pk for pk in ids if linked.get(pk)]
+        outcomes = {True: 'deleted', False: 'missing'}
+        apply = remove
+    if changed:
+        apply(changed)
+    results = []
+    for pk in ids:
+        if pk in invalid:
+            status = 'invalid'
+        elif pk not in linked:
+            status = 'not_found'
+        else:
+            status = outcomes[linked[pk]]
+        results.append({'id': pk, 'status': status})
+    return Response({'results': results})
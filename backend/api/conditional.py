@@ -0,0 +1,37 @@
+import hashlib
+
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date, quote_etag
+
+
+def recipe_validators(recipes, *extra):
+    """ETag и Last-Modified по датам изменения рецептов и флагам зрителя"""
+    digest = hashlib.md5(repr(extra).encode())
+    last_modified = None
+    for recipe in recipes:
+        digest.update(
+            f'{recipe.pk}:{recipe.updated_at.timestamp()}:'
+            f'{recipe.is_favorited:d}{recipe.is_in_shopping_cart:d}'
+            f'{recipe.is_subscribed:d};'.encode())
+        if last_modified is None or recipe.updated_at > last_modified:
+            last_modified = recipe.updated_at
+    return quote_etag(digest.hexdigest()), last_modified
+
+
+def conditional_response(request, etag, last_modified, build):
+    """Ответ 304, если клиент уже получил эту версию, иначе build().
+
+    If-Modified-Since учитывается только для анонимов: флаги избранного,
+    корзины и подписки меняются без изменения рецепта.
+    """
+    timestamp = last_modified and int(last_modified.timestamp())
+    response = get_conditional_response(
+        request, etag=etag,
+        last_modified=None if request.user.is_authenticated else timestamp)
+    if response is None:
+        response = build()
+    response['ETag'] = etag
+    if timestamp:
+        response['Last-Modified'] = http_date(timestamp)
+    patch_vary_headers(response, ('Authorization',))
+    return response
@@ -0,0 +1,112 @@
+import csv
+import io
+import os
+
+from django.conf import settings
+from fpdf import FPDF
+from fpdf.fpdf import SubsetMap
+from rest_framework.negotiation import DefaultContentNegotiation
+
+from app.models import ShoppingListItem
+
+FONT_PATH = os.path.join(settings.BASE_DIR, 'static', 'fonts',
+                         'DejaVuSansMono.ttf')
+CHUNK_SIZE = 64 * 1024
+
+
+def get_shopping_list(user):
+    """Список покупок пользователя из предрассчитанных сумм"""
+    return ShoppingListItem.objects.filter(user=user).values_list(
+        'ingredient__name', 'total_amount', 'ingredient__measurement_unit'
+    ).order_by('ingredient__name')
+
+
+class ExportNegotiation(DefaultContentNegotiation):
+    """?format= выбирает формат выгрузки, ошибки отдаются в JSON"""
+
+    def select_renderer(self, request, renderers, format_suffix=None):
+        return super().select_renderer(request, renderers,
+                                       format_suffix='json')
+
+
+class ShoppingListPDF(FPDF):
+    """FPDF, который разбирает файл шрифта один раз на процесс"""
+    _fonts = {}
+
+    def add_font(self, family, style='', fname=None, uni='DEPRECATED'):
+        fontkey = f'{family.lower()}{style}'
+        if fontkey not in self._fonts:
+            super().add_font(family, style, fname)
+            self._fonts[fontkey] = (self.fonts[fontkey],
+                                    self.font_files[fontkey])
+            return
+        font, font_file = self._fonts[fontkey]
+        subset = '\x00 '
+        if self.str_alias_nb_pages:
+            subset += '0123456789' + self.str_alias_nb_pages
+        self.fonts[fontkey] = {**font, 'i': len(self.fonts) + 1,
+                               'subset': SubsetMap(map(ord, subset))}
+        self.font_files[fontkey] = dict(font_file)
+
+
+class ShoppingListExporter:
+    content_type = None
+    extension = None
+
+    def __init__(self, items):
+        self.items = items
+
+    def lines(self):
+        return self.items.iterator()
+
+    def render(self):
+        raise NotImplementedError
+
+
+class TextExporter(ShoppingListExporter):
+    content_type = 'text/plain; charset=utf-8'
+    extension = 'txt'
+
+    def render(self):
+        for name, amount, unit in self.lines():
+            yield f'{name} {amount} {unit}\n'.encode()
+
+
+class CSVExporter(ShoppingListExporter):
+    content_type = 'text/csv; charset=utf-8'
+    extension = 'csv'
+
+    def render(self):
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(('Ингредиент', 'Количество', 'Единицы измерения'))
+        for line in self.lines():
+            writer.writerow(line)
+            yield buffer.getvalue().encode()
+            buffer.seek(0)
+            buffer.truncate()
+        yield buffer.getvalue().encode()
+
+
+class PDFExporter(ShoppingListExporter):
+    content_type = 'application/pdf'
+    extension = 'pdf'
+
+    def render(self):
+        pdf = ShoppingListPDF(orientation='P', unit='mm', format='A4')
+        pdf.add_page()
+        pdf.add_font('DejaVu', fname=FONT_PATH)
+        pdf.set_font('DejaVu', size=16)
+        for name, amount, unit in self.lines():
+            pdf.cell(60, 20, f'{name} {amount} {unit}',
+                     new_x='LMARGIN', new_y='NEXT')
+        content = pdf.output()
+        for start in range(0, len(content), CHUNK_SIZE):
+            yield bytes(content[start:start + CHUNK_SIZE])
+
+
+EXPORTERS = {
+    'pdf': PDFExporter,
+    'csv': CSVExporter,
+    'txt': TextExporter,
+}
@@ -0,0 +1,104 @@
+from collections import defaultdict
+
+from app.models import IngredientAmount, Recipe
+
+from .recipe_cache import recipe_fragments
+
+
+def storage_url(storage, name):
+    return storage.url(name) if name else None
+
+
+def absolute_url(origin, url):
+    """Абсолютный URL файла так же, как его отдаёт ImageField DRF"""
+    if url and url.startswith('/'):
+        return origin + url
+    return url
+
+
+def recipe_tags(recipe_ids):
+    tags = defaultdict(list)
+    rows = Recipe.tags.through.objects.filter(
+        recipe_id__in=recipe_ids).values_list(
+            'recipe_id', 'tag_id', 'tag__name', 'tag__color', 'tag__slug'
+    ).order_by('-tag_id')
+    for recipe_id, tag_id, name, color, slug in rows:
+        tags[recipe_id].append(
+            {'id': tag_id, 'name': name, 'color': color, 'slug': slug})
+    return tags
+
+
+def recipe_ingredients(recipe_ids):
+    ingredients = defaultdict(list)
+    rows = IngredientAmount.objects.filter(
+        recipe_id__in=recipe_ids).values_list(
+            'recipe_id', 'ingredients_id', 'ingredients__name',
+            'ingredients__measurement_unit', 'amount').order_by('-id')
+    for recipe_id, ingredient_id, name, unit, amount in rows:
+        ingredients[recipe_id].append(
+            {'id': str(ingredient_id), 'name': name,
+             'measurement_unit': unit, 'amount': amount})
+    return ingredients
+
+
+def build_fragments(recipes):
+    """Части представления рецептов, одинаковые для всех зрителей.
+
+    Теги и ингредиенты подтягиваются двумя запросами values_list на все
+    рецепты, URL картинок остаются относительными.
+    """
+    recipe_ids = [recipe.pk for recipe in recipes]
+    tags = recipe_tags(recipe_ids)
+    ingredients = recipe_ingredients(recipe_ids)
+    storage = Recipe._meta.get_field('image').storage
+    fragments = {}
+    for recipe in recipes:
+        author = recipe.author
+        fragments[recipe.pk] = {
+            'id': recipe.pk,
+            'tags': tags[recipe.pk],
+            'author': {
+                'email': author.email,
+                'id': author.pk,
+                'username': author.username,
+                'first_name': author.first_name,
+                'last_name': author.last_name,
+            },
+            'ingredients': ingredients[recipe.pk],
+            'name': recipe.name,
+            'image': storage_url(storage, recipe.image.name),
+            'thumbnail': storage_url(storage, recipe.thumbnail.name),
+            'image_webp': storage_url(storage, recipe.image_webp.name),
+            'text': recipe.text,
+            'cooking_time': recipe.cooking_time,
+        }
+    return fragments
+
+
+def serialize_recipes(recipes, request):
+    """То же представление, что RecipeGetSerializer, без полей DRF.
+
+    Рецепты должны быть загружены с with_user_flags() и автором. Общая
+    часть берётся из кэша фрагментов, флаги зрителя — из аннотаций.
+    """
+    fragments = recipe_fragments(recipes, build_fragments)
+    origin = request.build_absolute_uri('/')[:-1] if request else ''
+    data = []
+    for recipe in recipes:
+        fragment = fragments[recipe.pk]
+        data.append({
+            'id': fragment['id'],
+            'tags': fragment['tags'],
+            'author': {**fragment['author'],
+                       'is_subscribed': recipe.is_subscribed},
+            'ingredients': fragment['ingredients'],
+            'is_favorited': recipe.is_favorited,
+            'is_in_shopping_cart': recipe.is_in_shopping_cart,
+            'name': fragment['name'],
+            'image': absolute_url(origin, fragment['image']),
+            'thumbnail': absolute_url(origin, fragment['thumbnail']),
+            'image_webp': absolute_url(origin, fragment['image_webp']),
+            'text': fragment['text'],
+            'cooking_time': fragment['cooking_time'],
+        })
+    return data
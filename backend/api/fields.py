@@ -0,0 +1,51 @@
+import hashlib
+
+from django.conf import settings
+from drf_extra_fields.fields import Base64ImageField
+from rest_framework import serializers
+from rest_framework.exceptions import ValidationError
+
+
+class RecipeImageField(Base64ImageField):
+    """Base64-картинка с лимитом размера и именем по SHA-256 содержимого"""
+
+    def to_internal_value(self, base64_data):
+        max_size = settings.RECIPE_IMAGE_MAX_SIZE
+        if (isinstance(base64_data, str)
+                and len(base64_data) * 3 // 4 > max_size):
+            raise ValidationError(
+                f'Картинка не должна быть больше {max_size // 2 ** 20} МБ')
+        return super().to_internal_value(base64_data)
+
+    def get_file_name(self, decoded_file):
+        return hashlib.sha256(decoded_file).hexdigest()
+
+
+class BulkPrimaryKeyField(serializers.ListField):
+    """Список id, которые проверяются одним запросом id__in.
+
+    Повторы и несуществующие id возвращаются ошибками по индексу элемента.
+    """
+    child = serializers.IntegerField(min_value=1)
+
+    def __init__(self, queryset, **kwargs):
+        self.queryset = queryset
+        super().__init__(**kwargs)
+
+    def to_internal_value(self, data):
+        ids = super().to_internal_value(data)
+        objects = self.queryset.in_bulk(set(ids))
+        errors = {}
+        seen = set()
+        for index, pk in enumerate(ids):
+            if pk in seen:
+                errors[index] = [f'Значение {pk} указано повторно']
+            elif pk not in objects:
+                errors[index] = [f'Объект с id {pk} не существует']
+            seen.add(pk)
+        if errors:
+            raise ValidationError(errors)
+        return [objects[pk] for pk in ids]
+
+    def to_representation(self, value):
+        return [obj.pk for obj in value.all()]
@@ -1,18 +1,21 @@
 from django_filters.rest_framework import FilterSet, filters
 
-from app.models import Recipe, Tag
+from app.models import Recipe, Tag, tags_mask
 from users.models import User
 
 
 class CustomFilter(FilterSet):
     author = filters.ModelChoiceFilter(queryset=User.objects.all())
-    tags = filters.ModelMultipleChoiceFilter(
-        field_name='tags__slug',
-        to_field_name='slug',
-        queryset=Tag.objects.all())
+    tags = filters.CharFilter(method='filter_tags')
     is_favorited = filters.BooleanFilter(method='filter_is_favorited')
     is_in_shopping_cart = filters.BooleanFilter(
         method='filter_is_in_shopping_cart')
+    search = filters.CharFilter(method='filter_search')
+
+    def filter_tags(self, queryset, name, value):
+        slugs = self.request.query_params.getlist(name)
+        mask = tags_mask(Tag.objects.filter(slug__in=slugs).only('bit'))
+        return queryset.filter(tag_mask__hasany=mask)
 
     def filter_is_favorited(self, queryset, name, value):
         if value:
@@ -24,6 +27,11 @@ class CustomFilter(FilterSet):
             return queryset.filter(Shopping__subscriber=self.request.user)
         return queryset
 
+    def filter_search(self, queryset, name, value):
+        if value.strip():
+            return queryset.search(value)
+        return queryset
+
     class Meta:
         model = Recipe
         fields = ('tags', 'author')
@@ -0,0 +1,97 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+from app.admin import RecipeAdmin
+from app.models import Recipe, Tag
+from users.models import User
+
+from .benchmark_api import Command as ApiBenchmark
+from .benchmark_api import QueryTimer, percentile
+
+
+class Command(BaseCommand):
+    help = ('Время загрузки страниц админки на больших таблицах '
+            'во временной тестовой базе')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--recipes', type=int, default=100000)
+        parser.add_argument('--ingredients', type=int, default=2200)
+        parser.add_argument('--ingredients-per-recipe', type=int, default=3)
+        parser.add_argument('--iterations', type=int, default=5)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        random.seed(options['seed'])
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(
+            verbosity=0, autoclobber=True, serialize=False)
+        try:
+            start = time.perf_counter()
+            ApiBenchmark().seed({
+                'users': options['users'], 'recipes': options['recipes'],
+                'ingredients': options['ingredients'],
+                'ingredients_per_recipe': options['ingredients_per_recipe'],
+                'follows': 5, 'favorites': 20, 'carts': 5})
+            self.stdout.write(
+                f'Данные созданы за {time.perf_counter() - start:.1f} с')
+            results = self.run_pages(options['iterations'])
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+        for name, status, p50, p95, queries, size in results:
+            self.stdout.write(
+                f'{name:28} {status} p50={p50:8.1f}ms p95={p95:8.1f}ms '
+                f'queries={queries:3} size={size // 1024:5} KiB')
+
+    def pages(self):
+        recipe = Recipe.objects.order_by('-pk').first()
+        tag = Tag.objects.first()
+        middle = max(1, Recipe.objects.count() // RecipeAdmin.list_per_page
+                     // 2)
+        return [
+            ('recipe-changelist', '/admin/app/recipe/'),
+            ('recipe-changelist-page', f'/admin/app/recipe/?p={middle}'),
+            ('recipe-changelist-search', '/admin/app/recipe/?q=Рецепт 999'),
+            ('recipe-changelist-tag',
+             f'/admin/app/recipe/?tags__id__exact={tag.pk}'),
+            ('recipe-change', f'/admin/app/recipe/{recipe.pk}/change/'),
+            ('ingredientamount-changelist', '/admin/app/ingredientamount/'),
+            ('favorite-changelist', '/admin/app/favorite/'),
+            ('shoppingcart-changelist', '/admin/app/shoppingcart/'),
+            ('user-changelist', '/admin/users/user/'),
+            ('ingredient-autocomplete',
+             '/admin/autocomplete/?app_label=app&model_name=ingredientamount'
+             '&field_name=ingredients&term=ингредиент 1'),
+        ]
+
+    def run_pages(self, iterations):
+        admin = User.objects.create_superuser(
+            email='admin@benchmark.ru', username='admin', password='admin',
+            first_name='admin', last_name='admin')
+        client = Client()
+        client.force_login(admin)
+        results = []
+        for name, url in self.pages():
+            elapsed = []
+            queries = []
+            for _ in range(iterations):
+                timer = QueryTimer()
+                with connection.execute_wrapper(timer):
+                    start = time.perf_counter()
+                    response = client.get(url)
+                    elapsed.append(time.perf_counter() - start)
+                if response.status_code != 200:
+                    raise CommandError(
+                        f'{name}: ответ {response.status_code} на {url}')
+                queries.append(len(timer.durations))
+            results.append((
+                name, response.status_code,
+                percentile(elapsed, 50) * 1000, percentile(elapsed, 95) * 1000,
+                max(queries), len(response.content)))
+        return results
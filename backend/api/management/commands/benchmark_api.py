@@ -0,0 +1,324 @@
+import base64
+import io
+import json
+import random
+import tempfile
+import time
+
+from django.contrib.auth.hashers import make_password
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import (override_settings, setup_test_environment,
+                               teardown_test_environment)
+from PIL import Image
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from app.models import (Favorite, Ingredient, IngredientAmount, Recipe,
+                        ShoppingCart, ShoppingListItem, Tag)
+from app.search import rebuild_search_index
+from users.models import Follow, User
+
+# Бюджет SQL-запросов на один вызов эндпоинта при настройках по умолчанию.
+# Превышение валит прогон.
+QUERY_BUDGETS = {
+    'users-list': 9,
+    'users-detail': 3,
+    'users-me': 2,
+    'users-subscriptions': 4,
+    'users-subscribe-post': 6,
+    'users-subscribe-delete': 4,
+    'tags-list': 2,
+    'tags-detail': 2,
+    'ingredients-list': 2,
+    'ingredients-search': 2,
+    'ingredients-detail': 2,
+    'recipes-list': 5,
+    'recipes-list-filtered': 6,
+    'recipes-search': 5,
+    'recipes-detail': 4,
+    'recipes-create': 17,
+    'recipes-update': 24,
+    'recipes-delete': 12,
+    'recipes-favorite-post': 5,
+    'recipes-favorite-delete': 4,
+    'recipes-shopping-cart-post': 9,
+    'recipes-shopping-cart-delete': 9,
+    'recipes-download-shopping-cart': 2,
+    'users-subscribe-batch-post': 5,
+    'users-subscribe-batch-delete': 5,
+    'recipes-favorite-batch-post': 5,
+    'recipes-favorite-batch-delete': 5,
+    'recipes-shopping-cart-batch-post': 8,
+    'recipes-shopping-cart-batch-delete': 9,
+}
+
+
+def percentile(values, percent):
+    ordered = sorted(values)
+    index = max(0, int(round(percent / 100 * len(ordered))) - 1)
+    return ordered[index]
+
+
+class QueryTimer:
+    """Обёртка для connection.execute_wrapper: считает запросы и время БД"""
+
+    def __init__(self):
+        self.durations = []
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.durations.append(time.perf_counter() - start)
+
+
+def tiny_png():
+    buffer = io.BytesIO()
+    Image.new('RGB', (1, 1)).save(buffer, format='PNG')
+    encoded = base64.b64encode(buffer.getvalue()).decode()
+    return f'data:image/png;base64,{encoded}'
+
+
+class Command(BaseCommand):
+    help = ('Нагрузочный прогон всех эндпоинтов API на сгенерированных '
+            'данных во временной тестовой базе')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=50)
+        parser.add_argument('--recipes', type=int, default=500)
+        parser.add_argument('--ingredients', type=int, default=300)
+        parser.add_argument('--ingredients-per-recipe', type=int, default=6)
+        parser.add_argument('--follows', type=int, default=10,
+                            help='Подписок на одного пользователя')
+        parser.add_argument('--favorites', type=int, default=20,
+                            help='Избранных рецептов на одного пользователя')
+        parser.add_argument('--carts', type=int, default=10,
+                            help='Рецептов в корзине одного пользователя')
+        parser.add_argument('--iterations', type=int, default=20)
+        parser.add_argument('--limit', type=int, default=6,
+                            help='Размер страницы для списков')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--output', default='benchmark.json')
+        parser.add_argument('--budget', action='append', default=[],
+                            metavar='ENDPOINT=QUERIES',
+                            help='Переопределить бюджет запросов')
+
+    def handle(self, *args, **options):
+        budgets = dict(QUERY_BUDGETS)
+        for item in options['budget']:
+            name, _, value = item.partition('=')
+            if name not in budgets or not value.isdigit():
+                raise CommandError(f'Некорректный бюджет: {item}')
+            budgets[name] = int(value)
+        random.seed(options['seed'])
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(
+            verbosity=0, autoclobber=True, serialize=False)
+        try:
+            with tempfile.TemporaryDirectory() as media_root:
+                with override_settings(MEDIA_ROOT=media_root,
+                                       IMAGE_WORKERS=0):
+                    dataset = self.seed(options)
+                    results = self.run_endpoints(dataset, options, budgets)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+        report = {
+            'dataset': {key: options[key] for key in (
+                'users', 'recipes', 'ingredients', 'ingredients_per_recipe',
+                'follows', 'favorites', 'carts', 'iterations', 'limit')},
+            'endpoints': results,
+        }
+        with open(options['output'], 'w') as file:
+            json.dump(report, file, ensure_ascii=False, indent=2)
+        for row in results:
+            self.stdout.write(
+                f"{row['endpoint']:36} p50={row['p50_ms']:8.2f}ms "
+                f"p95={row['p95_ms']:8.2f}ms queries={row['queries']:3} "
+                f"db={row['db_time_ms']:7.2f}ms budget={row['budget']}")
+        failed = [row['endpoint'] for row in results if not row['ok']]
+        if failed:
+            raise CommandError(
+                f"Превышен бюджет запросов: {', '.join(failed)}")
+        self.stdout.write(self.style.SUCCESS(
+            f"Отчёт сохранён в {options['output']}"))
+
+    def seed(self, options):
+        password = make_password('benchmark')
+        User.objects.bulk_create(
+            User(email=f'user{i}@benchmark.ru', username=f'user{i}',
+                 first_name='Имя', last_name='Фамилия', password=password)
+            for i in range(options['users']))
+        users = list(User.objects.order_by('pk'))
+        tags = [Tag.objects.create(name=name, color=color, slug=slug)
+                for name, color, slug in (('Завтрак', '#E26C2D', 'breakfast'),
+                                          ('Обед', '#49B64E', 'lunch'),
+                                          ('Ужин', '#8775D2', 'dinner'))]
+        Ingredient.objects.bulk_create(
+            Ingredient(name=f'ингредиент {i}', measurement_unit='г')
+            for i in range(options['ingredients']))
+        ingredients = list(Ingredient.objects.all())
+        Recipe.objects.bulk_create(
+            Recipe(author=random.choice(users), name=f'Рецепт {i}',
+                   text='Описание рецепта', cooking_time=random.randint(1, 90))
+            for i in range(options['recipes']))
+        rebuild_search_index()
+        recipes = list(Recipe.objects.all())
+        Recipe.tags.through.objects.bulk_create(
+            Recipe.tags.through(recipe=recipe, tag=tag)
+            for recipe in recipes
+            for tag in random.sample(tags, random.randint(1, len(tags))))
+        Recipe.objects.sync_tag_mask()
+        per_recipe = min(options['ingredients_per_recipe'], len(ingredients))
+        IngredientAmount.objects.bulk_create(
+            IngredientAmount(recipe=recipe, ingredients=ingredient,
+                             amount=random.randint(1, 500))
+            for recipe in recipes
+            for ingredient in random.sample(ingredients, per_recipe))
+        for user in users:
+            authors = [author for author in users if author != user]
+            Follow.objects.bulk_create(
+                Follow(user=user, author=author) for author in
+                random.sample(authors, min(options['follows'], len(authors))))
+            for model, count in ((Favorite, options['favorites']),
+                                 (ShoppingCart, options['carts'])):
+                model.objects.bulk_create(
+                    model(subscriber=user, recipe=recipe) for recipe in
+                    random.sample(recipes, min(count, len(recipes))))
+        call_command('reconcile_counters', stdout=io.StringIO())
+        ShoppingListItem.objects.rebuild()
+        return {'users': users, 'tags': tags, 'ingredients': ingredients}
+
+    def endpoints(self, dataset, limit):
+        user = dataset['users'][0]
+        tag = dataset['tags'][0]
+        ingredient = dataset['ingredients'][0]
+        following = set(Follow.objects.filter(
+            user=user).values_list('author', flat=True))
+        author = User.objects.exclude(pk__in=following).exclude(
+            pk=user.pk).first() or user
+        recipe = Recipe.objects.exclude(author=user).exclude(
+            favorite__subscriber=user).exclude(
+                Shopping__subscriber=user).first()
+        own_recipe = Recipe.objects.filter(author=user).first()
+        batch = {'ids': list(Recipe.objects.exclude(
+            favorite__subscriber=user).exclude(
+                Shopping__subscriber=user).values_list('pk', flat=True)[:20])}
+        authors = {'ids': list(User.objects.exclude(
+            pk__in=following | {user.pk}).values_list('pk', flat=True)[:20])}
+        payload = {
+            'name': 'Рецепт для замера',
+            'text': 'Описание',
+            'cooking_time': 10,
+            'image': tiny_png(),
+            'tags': [tag.pk for tag in dataset['tags'][:2]],
+            'ingredients': [{'id': item.pk, 'amount': 10}
+                            for item in dataset['ingredients'][:5]],
+        }
+        endpoints = [
+            ('users-list', 'get', f'/api/users/?limit={limit}', None),
+            ('users-detail', 'get', f'/api/users/{author.pk}/', None),
+            ('users-me', 'get', '/api/users/me/', None),
+            ('users-subscriptions', 'get',
+             f'/api/users/subscriptions/?limit={limit}&recipes_limit=3',
+             None),
+            ('users-subscribe-post', 'post',
+             f'/api/users/{author.pk}/subscribe/', None),
+            ('users-subscribe-delete', 'delete',
+             f'/api/users/{author.pk}/subscribe/', None),
+            ('tags-list', 'get', '/api/tags/', None),
+            ('tags-detail', 'get', f'/api/tags/{tag.pk}/', None),
+            ('ingredients-list', 'get', '/api/ingredients/', None),
+            ('ingredients-search', 'get',
+             f'/api/ingredients/?name={ingredient.name[:4]}', None),
+            ('ingredients-detail', 'get',
+             f'/api/ingredients/{ingredient.pk}/', None),
+            ('recipes-list', 'get', f'/api/recipes/?limit={limit}', None),
+            ('recipes-list-filtered', 'get',
+             f'/api/recipes/?limit={limit}&tags={tag.slug}&is_favorited=1',
+             None),
+            ('recipes-search', 'get',
+             f'/api/recipes/?limit={limit}&search={recipe.name.split()[0]}',
+             None),
+            ('recipes-detail', 'get', f'/api/recipes/{recipe.pk}/', None),
+            ('recipes-create', 'post', '/api/recipes/', payload),
+            ('recipes-update', 'patch', f'/api/recipes/{own_recipe.pk}/'
+             if own_recipe else None, payload),
+            ('recipes-delete', 'delete', '/api/recipes/{created}/', None),
+            ('recipes-favorite-post', 'post',
+             f'/api/recipes/{recipe.pk}/favorite/', None),
+            ('recipes-favorite-delete', 'delete',
+             f'/api/recipes/{recipe.pk}/favorite/', None),
+            ('recipes-shopping-cart-post', 'post',
+             f'/api/recipes/{recipe.pk}/shopping_cart/', None),
+            ('recipes-shopping-cart-delete', 'delete',
+             f'/api/recipes/{recipe.pk}/shopping_cart/', None),
+            ('recipes-download-shopping-cart', 'get',
+             '/api/recipes/download_shopping_cart/', None),
+            ('users-subscribe-batch-post', 'post', '/api/users/subscribe/',
+             authors),
+            ('users-subscribe-batch-delete', 'delete',
+             '/api/users/subscribe/', authors),
+            ('recipes-favorite-batch-post', 'post', '/api/recipes/favorite/',
+             batch),
+            ('recipes-favorite-batch-delete', 'delete',
+             '/api/recipes/favorite/', batch),
+            ('recipes-shopping-cart-batch-post', 'post',
+             '/api/recipes/shopping_cart/', batch),
+            ('recipes-shopping-cart-batch-delete', 'delete',
+             '/api/recipes/shopping_cart/', batch),
+        ]
+        return [endpoint for endpoint in endpoints if endpoint[2]]
+
+    def run_endpoints(self, dataset, options, budgets):
+        user = dataset['users'][0]
+        token, _ = Token.objects.get_or_create(user=user)
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+        timings = {}
+        endpoints = self.endpoints(dataset, options['limit'])
+        created = None
+        for _ in range(options['iterations']):
+            for name, method, url, payload in endpoints:
+                url = url.format(created=created)
+                timer = QueryTimer()
+                with connection.execute_wrapper(timer):
+                    start = time.perf_counter()
+                    response = getattr(client, method)(
+                        url, payload, format='json')
+                    if getattr(response, 'streaming', False):
+                        b''.join(response.streaming_content)
+                    elapsed = time.perf_counter() - start
+                if response.status_code >= 400:
+                    raise CommandError(
+                        f'{name}: {method.upper()} {url} вернул '
+                        f'{response.status_code}')
+                if name == 'recipes-create':
+                    created = response.json()['id']
+                entry = timings.setdefault(
+                    name, {'method': method.upper(), 'path': url,
+                           'status': response.status_code,
+                           'elapsed': [], 'queries': [], 'db_time': []})
+                entry['elapsed'].append(elapsed * 1000)
+                entry['queries'].append(len(timer.durations))
+                entry['db_time'].append(sum(timer.durations) * 1000)
+        results = []
+        for name, entry in timings.items():
+            queries = max(entry['queries'])
+            results.append({
+                'endpoint': name,
+                'method': entry['method'],
+                'path': entry['path'],
+                'status': entry['status'],
+                'p50_ms': round(percentile(entry['elapsed'], 50), 3),
+                'p95_ms': round(percentile(entry['elapsed'], 95), 3),
+                'queries': queries,
+                'db_time_ms': round(
+                    sum(entry['db_time']) / len(entry['db_time']), 3),
+                'budget': budgets[name],
+                'ok': queries <= budgets[name],
+            })
+        return results
@@ -0,0 +1,82 @@
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import prefetch_related_objects
+from django.test.utils import setup_test_environment, teardown_test_environment
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from api.fast_serializers import serialize_recipes
+from api.serializers import RecipeGetSerializer
+from app.models import Recipe, recipe_prefetches
+
+from .benchmark_api import Command as ApiBenchmark
+
+
+def drf_payload(recipes, request):
+    prefetch_related_objects(recipes, *recipe_prefetches())
+    return RecipeGetSerializer(
+        recipes, many=True, context={'request': request}).data
+
+
+class Command(BaseCommand):
+    help = ('Сравнить RecipeGetSerializer и быстрый сериализатор: '
+            'совпадение JSON и время на 100 рецептов')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--recipes', type=int, default=500)
+        parser.add_argument('--page', type=int, default=100,
+                            help='Рецептов в одной сериализации')
+        parser.add_argument('--iterations', type=int, default=20)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        random.seed(options['seed'])
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(
+            verbosity=0, autoclobber=True, serialize=False)
+        try:
+            timings = self.run(options)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+        scale = 100 / options['page']
+        drf, fast = (statistics.median(timings[name]) * scale * 1000
+                     for name in ('drf', 'fast'))
+        self.stdout.write(
+            f'RecipeGetSerializer: {drf:8.2f} ms на 100 рецептов\n'
+            f'serialize_recipes:   {fast:8.2f} ms на 100 рецептов\n'
+            f'ускорение:           {drf / fast:8.1f}x')
+
+    def run(self, options):
+        dataset = ApiBenchmark().seed({
+            'users': 50, 'recipes': options['recipes'], 'ingredients': 300,
+            'ingredients_per_recipe': 6, 'follows': 10, 'favorites': 20,
+            'carts': 10})
+        user = dataset['users'][0]
+        with_images = Recipe.objects.values_list('pk', flat=True)[::2]
+        Recipe.objects.filter(pk__in=with_images).update(
+            image='recipes/images/benchmark.png',
+            thumbnail='recipes/thumbnails/benchmark.webp')
+        request = Request(APIRequestFactory().get('/api/recipes/'))
+        request.user = user
+        queryset = Recipe.objects.with_user_flags(user).select_related(
+            'author').defer('search_vector')
+        renderer = JSONRenderer()
+        timings = {'drf': [], 'fast': []}
+        for _ in range(options['iterations']):
+            results = {}
+            for name, build in (('drf', drf_payload),
+                                ('fast', serialize_recipes)):
+                recipes = list(queryset[:options['page']])
+                start = time.perf_counter()
+                results[name] = renderer.render(build(recipes, request))
+                timings[name].append(time.perf_counter() - start)
+            if results['drf'] != results['fast']:
+                raise CommandError(
+                    'Быстрый сериализатор расходится с RecipeGetSerializer')
+        return timings
@@ -0,0 +1,199 @@
+import asyncio
+import json
+import os
+import random
+import shutil
+import subprocess
+import tempfile
+import time
+from itertools import cycle
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from rest_framework.authtoken.models import Token
+
+from app.models import Recipe
+
+from .benchmark_api import Command as ApiBenchmark
+from .benchmark_api import percentile
+
+SERVERS = {
+    'wsgi': ('backend.wsgi:application',),
+    'asgi': ('backend.asgi:application',
+             '--worker-class', 'uvicorn.workers.UvicornWorker'),
+}
+DATASET = {
+    'users': 50,
+    'ingredients': 300,
+    'ingredients_per_recipe': 6,
+    'follows': 10,
+    'favorites': 20,
+    'carts': 10,
+}
+
+
+async def fetch(host, port, path, token, send_time=0):
+    """GET-запрос по сырому сокету; заголовки отправляются за send_time"""
+    start = time.perf_counter()
+    reader, writer = await asyncio.open_connection(host, port)
+    head = (f'GET {path} HTTP/1.1\r\nHost: {host}\r\n'
+            f'Authorization: Token {token}\r\nConnection: close\r\n\r\n'
+            ).encode()
+    parts = 10 if send_time else 1
+    size = -(-len(head) // parts)
+    try:
+        for offset in range(0, len(head), size):
+            writer.write(head[offset:offset + size])
+            await writer.drain()
+            if send_time:
+                await asyncio.sleep(send_time / parts)
+        response = await reader.read()
+    finally:
+        writer.close()
+    status = int(response.split(b' ', 2)[1]) if response else 0
+    return status, time.perf_counter() - start
+
+
+async def fast_client(host, port, paths, token, deadline, latencies, errors):
+    for path in cycle(paths):
+        if time.perf_counter() >= deadline:
+            return
+        try:
+            status, elapsed = await fetch(host, port, path, token)
+        except OSError:
+            status, elapsed = 0, 0
+        if status == 200:
+            latencies.append(elapsed * 1000)
+        else:
+            errors.append(status)
+
+
+async def slow_client(host, port, path, token, deadline, send_time):
+    while time.perf_counter() < deadline:
+        try:
+            await fetch(host, port, path, token, send_time)
+        except OSError:
+            await asyncio.sleep(send_time)
+
+
+class Command(BaseCommand):
+    help = ('Сравнить WSGI и ASGI режимы под конкурентной нагрузкой '
+            'с медленными клиентами')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--mode', action='append', choices=SERVERS,
+                            help='Какие режимы замерять (по умолчанию все)')
+        parser.add_argument('--workers', type=int, default=2,
+                            help='Процессов gunicorn')
+        parser.add_argument('--clients', type=int, default=32,
+                            help='Обычных клиентов')
+        parser.add_argument('--slow-clients', type=int, default=16,
+                            help='Клиентов, медленно отправляющих запрос')
+        parser.add_argument('--slow-seconds', type=float, default=2.0,
+                            help='За сколько медленный клиент шлёт запрос')
+        parser.add_argument('--duration', type=float, default=10.0,
+                            help='Длительность замера одного режима, с')
+        parser.add_argument('--recipes', type=int, default=500)
+        parser.add_argument('--port', type=int, default=8765)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--output', default='benchmark_servers.json')
+
+    def handle(self, *args, **options):
+        gunicorn = shutil.which('gunicorn')
+        if gunicorn is None:
+            raise CommandError('Для замера нужны gunicorn и uvicorn')
+        random.seed(options['seed'])
+        results = []
+        with tempfile.TemporaryDirectory() as workdir:
+            if connection.vendor == 'sqlite':
+                connection.settings_dict['TEST']['NAME'] = os.path.join(
+                    workdir, 'benchmark.sqlite3')
+            old_name = connection.creation.create_test_db(
+                verbosity=0, autoclobber=True, serialize=False)
+            try:
+                token, paths = self.prepare(options)
+                env = {**os.environ,
+                       'DB_NAME': connection.settings_dict['NAME']}
+                connection.close()
+                for mode in options['mode'] or SERVERS:
+                    results.append(self.run_mode(
+                        gunicorn, mode, env, token, paths, options))
+            finally:
+                connection.creation.destroy_test_db(old_name, verbosity=0)
+        with open(options['output'], 'w') as file:
+            json.dump({'options': {key: options[key] for key in (
+                'workers', 'clients', 'slow_clients', 'slow_seconds',
+                'duration', 'recipes')}, 'results': results},
+                file, ensure_ascii=False, indent=2)
+        for row in results:
+            self.stdout.write(
+                f"{row['mode']:5} rps={row['rps']:8.1f} "
+                f"p50={row['p50_ms']:8.1f}ms p95={row['p95_ms']:8.1f}ms "
+                f"p99={row['p99_ms']:8.1f}ms requests={row['requests']} "
+                f"errors={row['errors']}")
+        self.stdout.write(self.style.SUCCESS(
+            f"Отчёт сохранён в {options['output']}"))
+
+    def prepare(self, options):
+        dataset = ApiBenchmark().seed({**DATASET,
+                                       'recipes': options['recipes']})
+        user = dataset['users'][0]
+        token, _ = Token.objects.get_or_create(user=user)
+        recipe = Recipe.objects.first()
+        paths = ('/api/recipes/?limit=6', f'/api/recipes/{recipe.pk}/',
+                 '/api/tags/', f"/api/ingredients/?name={quote('ингр')}",
+                 '/api/users/subscriptions/?limit=6&recipes_limit=3')
+        return token.key, paths
+
+    def run_mode(self, gunicorn, mode, env, token, paths, options):
+        server = subprocess.Popen(
+            (gunicorn, *SERVERS[mode], '--workers', str(options['workers']),
+             '--bind', f"127.0.0.1:{options['port']}"),
+            cwd=settings.BASE_DIR, env=env,
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            result = asyncio.run(self.load(token, paths, options))
+        finally:
+            server.terminate()
+            server.wait()
+        return {'mode': mode, **result}
+
+    async def load(self, token, paths, options):
+        host, port = '127.0.0.1', options['port']
+        await self.wait_ready(host, port)
+        deadline = time.perf_counter() + options['duration']
+        latencies, errors = [], []
+        start = time.perf_counter()
+        await asyncio.gather(
+            *(fast_client(host, port, paths[index % len(paths):] + paths,
+                          token, deadline, latencies, errors)
+              for index in range(options['clients'])),
+            *(slow_client(host, port, paths[0], token, deadline,
+                          options['slow_seconds'])
+              for _ in range(options['slow_clients'])))
+        elapsed = time.perf_counter() - start
+        if not latencies:
+            raise CommandError('Сервер не ответил ни на один запрос')
+        return {
+            'requests': len(latencies),
+            'errors': len(errors),
+            'rps': round(len(latencies) / elapsed, 1),
+            'p50_ms': round(percentile(latencies, 50), 1),
+            'p95_ms': round(percentile(latencies, 95), 1),
+            'p99_ms': round(percentile(latencies, 99), 1),
+        }
+
+    async def wait_ready(self, host, port, timeout=30):
+        deadline = time.perf_counter() + timeout
+        while True:
+            try:
+                status, _ = await fetch(host, port, '/api/tags/', '')
+            except OSError:
+                status = 0
+            if status:
+                return
+            if time.perf_counter() >= deadline:
+                raise CommandError(f'Сервер на порту {port} не запустился')
+            await asyncio.sleep(0.2)
@@ -0,0 +1,63 @@
+import ipaddress
+import os
+
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden
+from prometheus_client import (CONTENT_TYPE_LATEST, REGISTRY,
+                               CollectorRegistry, Counter, Histogram,
+                               generate_latest, multiprocess)
+
+LABELS = ('route', 'action', 'method')
+
+REQUESTS = Counter(
+    'api_requests_total', 'Запросы к API по классу статуса ответа',
+    LABELS + ('status',))
+LATENCY = Histogram(
+    'api_request_duration_seconds', 'Время обработки запроса', LABELS)
+DB_TIME = Histogram(
+    'api_request_db_seconds', 'Время SQL-запросов за один запрос', LABELS,
+    buckets=(.001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 2.5))
+QUERIES = Histogram(
+    'api_request_queries', 'Число SQL-запросов за один запрос', LABELS,
+    buckets=(0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 89))
+RESPONSE_SIZE = Histogram(
+    'api_response_size_bytes', 'Размер тела ответа', LABELS,
+    buckets=(256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304))
+RECIPE_FRAGMENTS = Counter(
+    'api_recipe_fragments_total',
+    'Фрагменты рецептов: взятые из кэша (hit) и собранные заново (miss)',
+    ('result',))
+
+
+def observe(labels, status, duration, profile, size):
+    REQUESTS.labels(*labels, f'{status // 100}xx').inc()
+    LATENCY.labels(*labels).observe(duration)
+    DB_TIME.labels(*labels).observe(profile.duration)
+    QUERIES.labels(*labels).observe(profile.count)
+    if size is not None:
+        RESPONSE_SIZE.labels(*labels).observe(size)
+
+
+def is_internal(address):
+    try:
+        address = ipaddress.ip_address(address)
+    except ValueError:
+        return False
+    return any(address in ipaddress.ip_network(network)
+               for network in settings.METRICS_ALLOWED_NETWORKS)
+
+
+def metrics_view(request):
+    """Метрики в текстовом формате Prometheus, только из внутренней сети.
+
+    Если задан PROMETHEUS_MULTIPROC_DIR, значения собираются из файлов
+    всех воркеров gunicorn.
+    """
+    if not is_internal(request.META.get('REMOTE_ADDR', '')):
+        return HttpResponseForbidden()
+    registry = REGISTRY
+    if os.getenv('PROMETHEUS_MULTIPROC_DIR'):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    return HttpResponse(generate_latest(registry),
+                        content_type=CONTENT_TYPE_LATEST)
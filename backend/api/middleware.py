@@ -0,0 +1,208 @@
+import asyncio
+import logging
+import time
+from types import MethodType
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+
+from .metrics import observe
+from .profiling import QueryProfile, QueryTotals, current_profile
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncCapableMiddleware:
+    """Основа для middleware, работающего в синхронной и асинхронной цепочке.
+
+    Под ASGI синхронный middleware Django выполняет в одном общем потоке и
+    держит его до конца запроса, поэтому запросы шли бы строго по очереди.
+    Хуки process_view и process_template_response в асинхронной цепочке
+    подменяются корутинами, чтобы не переходить в этот поток.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = asyncio.iscoroutinefunction(get_response)
+        if self.is_async:
+            # Признак, по которому Django 3.2 ожидает корутину от __call__
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+            for name in ('process_view', 'process_template_response'):
+                hook = getattr(self, name, None)
+                if hook is not None:
+                    setattr(self, name, self.async_hook(hook))
+
+    @staticmethod
+    def async_hook(hook):
+        # Django берёт у хука __self__, поэтому обёртка тоже метод
+        async def wrapper(self, *args):
+            return hook(*args)
+
+        return MethodType(wrapper, hook.__self__)
+
+
+class MetricsMiddleware(AsyncCapableMiddleware):
+    """Метрики Prometheus по маршруту и действию представления DRF"""
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        profile = QueryTotals()
+        token = current_profile.set(profile)
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            current_profile.reset(token)
+        self.observe(request, response, profile, start)
+        return response
+
+    async def __acall__(self, request):
+        profile = QueryTotals()
+        token = current_profile.set(profile)
+        start = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            current_profile.reset(token)
+        self.observe(request, response, profile, start)
+        return response
+
+    @staticmethod
+    def labels(request):
+        match = getattr(request, 'resolver_match', None)
+        if match is None or not hasattr(match.func, 'cls'):
+            return None
+        actions = getattr(match.func, 'actions', None) or {}
+        return (match.url_name or '',
+                actions.get(request.method.lower(), ''), request.method)
+
+    def observe(self, request, response, profile, start):
+        labels = self.labels(request)
+        if labels is None:
+            return
+        size = None
+        if not response.streaming:
+            size = len(response.content)
+        observe(labels, response.status_code, time.perf_counter() - start,
+                profile, size)
+
+
+class ProfilingMiddleware(AsyncCapableMiddleware):
+    """Профилирование запросов: SQL, время представления и рендеринга.
+
+    Включается настройкой PROFILE_REQUESTS или заголовком X-Profile: 1 от
+    сотрудника. Итоги уходят в заголовок Server-Timing, медленные запросы
+    пишутся в лог вместе с самыми долгими и повторяющимися SQL.
+    """
+
+    @staticmethod
+    def enabled(request):
+        return (settings.PROFILE_REQUESTS
+                or request.headers.get('X-Profile') == '1')
+
+    @staticmethod
+    def start(request):
+        profile = QueryProfile(parent=current_profile.get())
+        token = current_profile.set(profile)
+        request.profile_timings = {'start': time.perf_counter()}
+        return profile, token
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        if not self.enabled(request):
+            return self.get_response(request)
+        profile, token = self.start(request)
+        try:
+            response = self.get_response(request)
+        finally:
+            current_profile.reset(token)
+        return self.finish(request, response, profile)
+
+    async def __acall__(self, request):
+        if not self.enabled(request):
+            return await self.get_response(request)
+        profile, token = self.start(request)
+        try:
+            response = await self.get_response(request)
+        finally:
+            current_profile.reset(token)
+        # request.user может быть ленивым и обратиться к базе
+        return await sync_to_async(self.finish, thread_sensitive=False)(
+            request, response, profile)
+
+    def finish(self, request, response, profile):
+        timings = request.profile_timings
+        timings['end'] = time.perf_counter()
+        user = getattr(request, 'user', None)
+        if settings.PROFILE_REQUESTS or getattr(user, 'is_staff', False):
+            response['Server-Timing'] = self.server_timing(profile, timings)
+        self.log_slow(request, profile, timings)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if hasattr(request, 'profile_timings'):
+            request.profile_timings['view'] = time.perf_counter()
+
+    def process_template_response(self, request, response):
+        timings = getattr(request, 'profile_timings', None)
+        if timings is None:
+            return response
+        timings['render'] = time.perf_counter()
+        render = response.render
+
+        def timed_render():
+            try:
+                return render()
+            finally:
+                timings['rendered'] = time.perf_counter()
+
+        response.render = timed_render
+        return response
+
+    @staticmethod
+    def durations(profile, timings):
+        end = timings['end']
+        view_start = timings.get('view', timings['start'])
+        view_end = timings.get('render', end)
+        render = timings.get('rendered', view_end) - view_end
+        db = profile.duration
+        return {
+            'total': end - timings['start'],
+            'db': db,
+            'app': max(view_end - view_start - db, 0),
+            'render': render,
+        }
+
+    def server_timing(self, profile, timings):
+        durations = self.durations(profile, timings)
+        repeated = profile.repeated(settings.PROFILE_REPEATED_QUERIES)
+        metrics = [
+            f'db;dur={durations["db"] * 1000:.1f};'
+            f'desc="{profile.count} queries"',
+            f'app;dur={durations["app"] * 1000:.1f};desc="view+serializer"',
+            f'render;dur={durations["render"] * 1000:.1f}',
+            f'total;dur={durations["total"] * 1000:.1f}',
+        ]
+        if repeated:
+            metrics.append(
+                f'repeated;desc="{len(repeated)} SQL x{repeated[0][1]}, '
+                f'{profile.duplicates()} duplicates"')
+        return ', '.join(metrics)
+
+    def log_slow(self, request, profile, timings):
+        durations = self.durations(profile, timings)
+        if durations['total'] * 1000 < settings.PROFILE_SLOW_REQUEST_MS:
+            return
+        lines = [f'{duration * 1000:8.1f} ms  {sql}'
+                 for sql, _, duration in profile.slowest(5)]
+        lines += [f'{count:5}x repeated  {sql}' for sql, count
+                  in profile.repeated(settings.PROFILE_REPEATED_QUERIES)]
+        logger.warning(
+            'Медленный запрос %s %s: %.1f ms, %d SQL за %.1f ms\n%s',
+            request.method, request.get_full_path(),
+            durations['total'] * 1000, profile.count,
+            durations['db'] * 1000, '\n'.join(lines))
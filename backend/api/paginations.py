@@ -1,5 +1,35 @@
-from rest_framework.pagination import PageNumberPagination
+from rest_framework.pagination import CursorPagination, PageNumberPagination
 
 
 class CustomPagination(PageNumberPagination):
     page_size_query_param = 'limit'
+
+
+class RecipeCursorPagination(CursorPagination):
+    ordering = '-id'
+    page_size_query_param = 'limit'
+
+
+class RecipePagination(CustomPagination):
+    """Постраничная пагинация рецептов.
+
+    ?pagination=cursor включает курсорный режим по -id: без COUNT(*) и
+    OFFSET, с непрозрачными ссылками next/previous. Если у выборки свой
+    порядок, например релевантность поиска, остаются номера страниц.
+    """
+    cursor_pagination_class = RecipeCursorPagination
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.cursor_paginator = None
+        cursor = ('cursor' in request.query_params
+                  or request.query_params.get('pagination') == 'cursor')
+        if cursor and not queryset.query.order_by:
+            self.cursor_paginator = self.cursor_pagination_class()
+            return self.cursor_paginator.paginate_queryset(
+                queryset, request, view)
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.cursor_paginator is not None:
+            return self.cursor_paginator.get_paginated_response(data)
+        return super().get_paginated_response(data)
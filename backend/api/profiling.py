@@ -0,0 +1,72 @@
+import time
+from collections import Counter
+from contextvars import ContextVar
+
+current_profile = ContextVar('current_profile', default=None)
+
+
+class QueryTotals:
+    """Число и суммарное время SQL-запросов, без текста и параметров"""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+
+    def add(self, sql, params, duration):
+        self.count += 1
+        self.duration += duration
+
+
+class QueryProfile(QueryTotals):
+    """SQL-запросы одного запроса к API: текст, параметры и время.
+
+    Итоги передаются и во внешние счётчики parent, если они заданы.
+    """
+
+    def __init__(self, parent=None):
+        super().__init__()
+        self.queries = []
+        self.parent = parent
+
+    def add(self, sql, params, duration):
+        super().add(sql, params, duration)
+        self.queries.append((sql, params, duration))
+        if self.parent is not None:
+            self.parent.add(sql, params, duration)
+
+    def slowest(self, limit):
+        return sorted(self.queries, key=lambda query: query[2],
+                      reverse=True)[:limit]
+
+    def repeated(self, threshold):
+        """Шаблоны SQL, выполненные не меньше threshold раз (признак N+1)"""
+        counts = Counter(sql for sql, _, _ in self.queries)
+        return [(sql, count) for sql, count in counts.most_common()
+                if count >= threshold]
+
+    def duplicates(self):
+        """Число полностью совпадающих запросов, включая параметры"""
+        counts = Counter((sql, repr(params)) for sql, params, _
+                         in self.queries)
+        return sum(count - 1 for count in counts.values())
+
+
+def record_queries(execute, sql, params, many, context):
+    profile = current_profile.get()
+    if profile is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        profile.add(sql, params, time.perf_counter() - start)
+
+
+def install_query_recorder(sender, connection, **kwargs):
+    """Подключить запись запросов к каждому новому соединению с БД.
+
+    Профиль хранится в contextvar, поэтому запросы из пула потоков
+    ASGI-режима попадают в профиль своего HTTP-запроса.
+    """
+    if record_queries not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_queries)
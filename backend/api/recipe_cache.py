@@ -0,0 +1,47 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from .metrics import RECIPE_FRAGMENTS
+
+FRAGMENT_KEY = 'recipe:fragment:{pk}'
+
+
+def fragment_key(pk):
+    return FRAGMENT_KEY.format(pk=pk)
+
+
+def recipe_fragments(recipes, build):
+    """Не зависящие от зрителя части рецептов: из кэша или через build().
+
+    Запись хранится вместе с updated_at рецепта и не используется, если
+    рецепт с тех пор менялся. Недостающие фрагменты собираются одним
+    вызовом build() для всех промахов и кладутся в кэш.
+    """
+    keys = {fragment_key(recipe.pk): recipe for recipe in recipes}
+    cached = cache.get_many(keys)
+    fragments = {}
+    missing = []
+    for key, recipe in keys.items():
+        entry = cached.get(key)
+        if entry is not None and entry[0] == recipe.updated_at:
+            fragments[recipe.pk] = entry[1]
+        else:
+            missing.append(recipe)
+    RECIPE_FRAGMENTS.labels('hit').inc(len(fragments))
+    RECIPE_FRAGMENTS.labels('miss').inc(len(missing))
+    if missing:
+        built = build(missing)
+        cache.set_many(
+            {fragment_key(recipe.pk): (recipe.updated_at, built[recipe.pk])
+             for recipe in missing},
+            settings.RECIPE_FRAGMENT_TIMEOUT)
+        fragments.update(built)
+    return fragments
+
+
+def forget_recipes(recipe_ids, using=None):
+    """Сбросить фрагменты рецептов после фиксации транзакции"""
+    keys = [fragment_key(pk) for pk in recipe_ids]
+    if keys:
+        transaction.on_commit(lambda: cache.delete_many(keys), using=using)
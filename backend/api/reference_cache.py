@@ -0,0 +1,64 @@
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.http import parse_etags, quote_etag
+from rest_framework import status
+from rest_framework.response import Response
+
+VERSION_KEY = 'reference:{kind}:version'
+PAYLOAD_KEY = 'reference:{kind}:{version}:{variant}'
+
+
+def get_version(kind):
+    key = VERSION_KEY.format(kind=kind)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, time.time_ns(), settings.REFERENCE_CACHE_TIMEOUT)
+        return cache.get(key)
+    return version
+
+
+def bump_version(kind):
+    key = VERSION_KEY.format(kind=kind)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, time.time_ns(), settings.REFERENCE_CACHE_TIMEOUT)
+
+
+class ReferenceCacheMixin:
+    """Кэширует сериализованные справочники под счётчиком версии.
+
+    Счётчик увеличивается сигналами при изменении модели, ETag строится
+    из версии, поэтому ответ 304 отдаётся без обращения к ORM.
+    """
+    reference_kind = None
+
+    def cached_response(self, request, variant, build):
+        version = get_version(self.reference_kind)
+        variant = hashlib.md5(variant.encode()).hexdigest()
+        etag = quote_etag(f'{self.reference_kind}-{version}-{variant}')
+        if etag in parse_etags(request.headers.get('If-None-Match', '')):
+            return Response(status=status.HTTP_304_NOT_MODIFIED,
+                            headers={'ETag': etag})
+        key = PAYLOAD_KEY.format(kind=self.reference_kind, version=version,
+                                 variant=variant)
+        data = cache.get(key)
+        if data is None:
+            data = build()
+            cache.set(key, data, settings.REFERENCE_CACHE_TIMEOUT)
+        return Response(data, headers={'ETag': etag})
+
+    def list(self, request, *args, **kwargs):
+        build = super().list
+        return self.cached_response(
+            request, f'list?{request.query_params.urlencode()}',
+            lambda: build(request, *args, **kwargs).data)
+
+    def retrieve(self, request, *args, **kwargs):
+        build = super().retrieve
+        return self.cached_response(
+            request, f'detail:{kwargs[self.lookup_field]}',
+            lambda: build(request, *args, **kwargs).data)
@@ -1,16 +1,31 @@
+import os
+
+from django.conf import settings
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db import transaction
+from django.db.models import prefetch_related_objects
 from djoser.serializers import UserSerializer
-from drf_extra_fields.fields import Base64ImageField
 from rest_framework import serializers
 
+from app.images import schedule_image_processing
 from app.models import (Favorite, Ingredient, IngredientAmount, Recipe,
-                        ShoppingCart, Tag)
+                        ShoppingCart, ShoppingListItem, Tag,
+                        recipe_prefetches, tags_mask)
 from users.models import Follow, User
 
+from .fields import BulkPrimaryKeyField, RecipeImageField
+
 
 class TagSerializer(serializers.ModelSerializer):
     class Meta:
         model = Tag
-        fields = '__all__'
+        fields = ('id', 'name', 'color', 'slug')
+
+    def create(self, validated_data):
+        try:
+            return super().create(validated_data)
+        except DjangoValidationError as error:
+            raise serializers.ValidationError(error.messages)
 
 
 class IngredientSerializer(serializers.ModelSerializer):
@@ -22,13 +37,16 @@ class IngredientSerializer(serializers.ModelSerializer):
 class RecipeSerializer(serializers.ModelSerializer):
     class Meta:
         model = Recipe
-        fields = ('id', 'name', 'image', 'cooking_time')
+        fields = ('id', 'name', 'image', 'thumbnail', 'image_webp',
+                  'cooking_time')
 
 
 class CustomUserSerializer(UserSerializer):
     is_subscribed = serializers.SerializerMethodField()
 
     def get_is_subscribed(self, obj):
+        if hasattr(obj, 'is_subscribed'):
+            return obj.is_subscribed
         user = self.context['request'].user
         return user.is_authenticated and Follow.objects.filter(author=obj.id,
                                                                user=user
@@ -40,16 +58,10 @@ class CustomUserSerializer(UserSerializer):
         model = User
 
 
-class FollowerCreateSerializer(UserSerializer):
-    class Meta:
-        model = Follow
-        fields = ('author', 'user')
-
-    def validate(self, data):
-        if data['author'] == data['user']:
-            raise serializers.ValidationError(
-                'Нельзя подписываться на себя')
-        return data
+def recipes_limit(request):
+    """recipes_limit из запроса или None, если он не задан числом"""
+    limit = request.query_params.get('recipes_limit', '') if request else ''
+    return int(limit) if limit.isdecimal() else None
 
 
 class FollowerListSerializer(UserSerializer):
@@ -59,22 +71,19 @@ class FollowerListSerializer(UserSerializer):
     first_name = serializers.ReadOnlyField(source='author.first_name')
     last_name = serializers.ReadOnlyField(source='author.last_name')
     recipes = serializers.SerializerMethodField()
-    recipes_count = serializers.SerializerMethodField()
+    recipes_count = serializers.ReadOnlyField(source='author.recipes_count')
     is_subscribed = serializers.SerializerMethodField()
 
-    def get_recipes_count(self, obj):
-        return Recipe.objects.filter(author=obj.author).count()
-
     def get_is_subscribed(self, obj):
-        user = self.context['request'].user
-        return Follow.objects.filter(author=obj.author, user=user).exists()
+        return True
 
     def get_recipes(self, obj):
-        request = self.context.get('request')
-        limit = request.GET.get('recipes_limit')
+        if hasattr(obj, 'latest_recipes'):
+            return RecipeSerializer(obj.latest_recipes, many=True).data
+        limit = recipes_limit(self.context.get('request'))
         queryset = Recipe.objects.filter(author=obj.author)
-        if limit:
-            queryset = queryset[:int(limit)]
+        if limit is not None:
+            queryset = queryset[:limit]
         return RecipeSerializer(queryset, many=True).data
 
     class Meta:
@@ -111,40 +120,48 @@ class RecipePostSerializer(serializers.ModelSerializer):
     ingredients = AmountSerializerPost(
         source='ingredient_amount',
         many=True,)
-    image = Base64ImageField()
+    tags = BulkPrimaryKeyField(
+        queryset=Tag.objects.all(), allow_empty=False,
+        error_messages={'empty': 'Необходимо указать теги'})
+    image = RecipeImageField()
 
     class Meta:
         model = Recipe
-        fields = '__all__'
+        exclude = ('updated_at', 'image_hash', 'thumbnail', 'image_webp',
+                   'search_vector', 'tag_mask')
         read_only_fields = ('image',)
 
-    def validate_tags(self, value):
-        tags_list = []
-        for tag in value:
-            if not tag:
-                raise serializers.ValidationError(
-                    'Необходимо указать теги')
-            if tag in tags_list:
-                raise serializers.ValidationError(
-                    'Нельзя указывать 2 одинаковых ингредиента')
-            tags_list.append(tag)
+    def validate_ingredients(self, value):
+        if not value:
+            raise serializers.ValidationError(
+                'Необходимо ввести ингредиенты')
+        errors = [{} for _ in value]
+        seen = set()
+        for item, error in zip(value, errors):
+            ingredient_id = str(item['ingredients']['id'])
+            if not ingredient_id.isdecimal():
+                error['id'] = ['Id ингредиента должен быть числом']
+                continue
+            item['ingredients']['id'] = int(ingredient_id)
+            if item['ingredients']['id'] in seen:
+                error['id'] = ['Ингридиенты должны быть уникальными']
+            seen.add(item['ingredients']['id'])
+            if item['amount'] <= 0:
+                error['amount'] = ['Значение количества должно быть больше 0']
+        existing = set(Ingredient.objects.filter(
+            id__in=seen).values_list('id', flat=True))
+        for item, error in zip(value, errors):
+            if 'id' not in error and item['ingredients']['id'] not in existing:
+                error['id'] = [
+                    f'Ингредиент с id {item["ingredients"]["id"]} не найден']
+        if any(errors):
+            raise serializers.ValidationError(errors)
         return value
 
     def validate(self, data):
-        ingredients = data['ingredient_amount']
-        if not ingredients:
-            raise serializers.ValidationError(
-                'Необходимо ввести ингредиенты')
-        ingredients_list = []
-        for ingredient_value in ingredients:
-            ingredient_id = ingredient_value['ingredients']
-            if ingredient_id in ingredients_list:
-                raise serializers.ValidationError(
-                    'Ингридиенты должны быть уникальными')
-            ingredients_list.append(ingredient_id)
-            if int(ingredient_value['amount']) <= 0:
-                raise serializers.ValidationError(
-                    'Значение количества должно быть больше 0')
+        if data.get('image'):
+            data['image_hash'] = os.path.splitext(
+                os.path.basename(data['image'].name))[0]
         return data
 
     def add_ingredients(self, ingredients_list, recipe):
@@ -153,22 +170,74 @@ class RecipePostSerializer(serializers.ModelSerializer):
                               recipe=recipe, amount=ingredient['amount'])
              for ingredient in ingredients_list])
 
+    def sync_ingredients(self, ingredients_list, recipe):
+        """Изменить только отличающиеся количества ингредиентов рецепта.
+
+        Возвращает id ингредиентов, которые были добавлены, удалены или
+        изменены.
+        """
+        amounts = {ingredient['ingredients']['id']: ingredient['amount']
+                   for ingredient in ingredients_list}
+        existing = {amount.ingredients_id: amount
+                    for amount in recipe.ingredient_amount.all()}
+        removed = existing.keys() - amounts.keys()
+        added = amounts.keys() - existing.keys()
+        changed = [amount for ingredient_id, amount in existing.items()
+                   if ingredient_id in amounts
+                   and amount.amount != amounts[ingredient_id]]
+        if removed:
+            IngredientAmount.objects.filter(
+                recipe=recipe, ingredients__in=removed).delete()
+        for amount in changed:
+            amount.amount = amounts[amount.ingredients_id]
+        if changed:
+            IngredientAmount.objects.bulk_update(changed, ('amount',))
+        if added:
+            self.add_ingredients(
+                [ingredient for ingredient in ingredients_list
+                 if ingredient['ingredients']['id'] in added], recipe)
+        return removed | added | {amount.ingredients_id for amount in changed}
+
+    @transaction.atomic
     def create(self, validated_data, *args):
         ingredients_list = validated_data.pop('ingredient_amount')
         tags = validated_data.pop('tags')
-        recipe = Recipe.objects.create(**validated_data)
+        recipe = Recipe.objects.create(tag_mask=tags_mask(tags),
+                                       **validated_data)
         recipe.tags.set(tags)
         self.add_ingredients(ingredients_list, recipe)
+        if recipe.image:
+            schedule_image_processing(recipe.pk)
         return recipe
 
+    @transaction.atomic
     def update(self, instance, validated_data):
-        IngredientAmount.objects.filter(recipe=instance).delete()
-        instance.tags.clear()
         ingredients_list = validated_data.pop('ingredient_amount')
         tags = validated_data.pop('tags')
         instance.tags.set(tags)
-        self.add_ingredients(ingredients_list, recipe=instance)
-        return super().update(instance, validated_data)
+        instance.tag_mask = tags_mask(tags)
+        changed_ingredients = self.sync_ingredients(ingredients_list,
+                                                    instance)
+        if changed_ingredients:
+            ShoppingListItem.objects.rebuild(
+                users=instance.Shopping.values('subscriber'),
+                ingredients=changed_ingredients)
+        image_changed = ('image_hash' in validated_data
+                         and validated_data['image_hash']
+                         != instance.image_hash)
+        if image_changed:
+            validated_data.update(thumbnail=None, image_webp=None)
+        else:
+            validated_data.pop('image', None)
+            validated_data.pop('image_hash', None)
+        instance = super().update(instance, validated_data)
+        if image_changed and instance.image:
+            schedule_image_processing(instance.pk)
+        return instance
+
+    def to_representation(self, instance):
+        prefetch_related_objects([instance], *recipe_prefetches())
+        return super().to_representation(instance)
 
 
 class RecipeGetSerializer(serializers.ModelSerializer):
@@ -184,19 +253,29 @@ class RecipeGetSerializer(serializers.ModelSerializer):
     is_in_shopping_cart = serializers.SerializerMethodField()
 
     def get_is_favorited(self, obj):
+        if hasattr(obj, 'is_favorited'):
+            return obj.is_favorited
         user = self.context['request'].user
         return Favorite.objects.filter(
             subscriber=user.id, recipe=obj.id).exists()
 
     def get_is_in_shopping_cart(self, obj):
+        if hasattr(obj, 'is_in_shopping_cart'):
+            return obj.is_in_shopping_cart
         user = self.context['request'].user
         return ShoppingCart.objects.filter(
             subscriber=user.id, recipe=obj.id).exists()
 
+    def to_representation(self, instance):
+        if hasattr(instance, 'is_subscribed'):
+            instance.author.is_subscribed = instance.is_subscribed
+        return super().to_representation(instance)
+
     class Meta:
         model = Recipe
         fields = ('id', 'tags', 'author', 'ingredients', 'is_favorited',
-                  'is_in_shopping_cart', 'name', 'image', 'text',
+                  'is_in_shopping_cart', 'name', 'image', 'thumbnail',
+                  'image_webp', 'text',
                   'cooking_time')
 
 
@@ -222,37 +301,12 @@ class ShoppingCartSerializer(serializers.ModelSerializer):
         fields = ('id', 'name', 'cooking_time')
 
 
-class AddFavoriteSerializer(serializers.ModelSerializer):
-
-    class Meta:
-        model = Favorite
-        fields = ('recipe', 'subscriber')
-
-    def validate(self, data):
-        recipe = data['recipe']
-        subscriber = data['subscriber']
-        if Favorite.objects.filter(
-            recipe=recipe,
-            subscriber=subscriber
-        ).exists():
-            raise serializers.ValidationError(
-                'Рецепт уже добавлен в избранное')
-        return data
-
-
-class AddShoppingSerializer(serializers.ModelSerializer):
-
-    class Meta:
-        model = ShoppingCart
-        fields = ('recipe', 'subscriber')
+class BatchIdsSerializer(serializers.Serializer):
+    ids = serializers.ListField(child=serializers.IntegerField(min_value=1),
+                                allow_empty=False)
 
-    def validate(self, data):
-        recipe = data['recipe']
-        subscriber = data['subscriber']
-        if ShoppingCart.objects.filter(
-            recipe=recipe,
-            subscriber=subscriber
-        ).exists():
+    def validate_ids(self, ids):
+        if len(ids) > settings.BATCH_MAX_SIZE:
             raise serializers.ValidationError(
-                'Рецепт уже добавлен в cписок покупок')
-        return data
+                f'Не больше {settings.BATCH_MAX_SIZE} id в одном запросе')
+        return list(dict.fromkeys(ids))
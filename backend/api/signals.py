@@ -0,0 +1,134 @@
+from django.db.backends.signals import connection_created
+from django.db.models.signals import (m2m_changed, post_delete, post_save,
+                                      pre_delete)
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+
+from app.models import (Ingredient, IngredientAmount, Recipe,
+                        ShoppingCart, ShoppingListItem, Tag,
+                        rebuilding_shopping_lists)
+from app.ingredient_index import ingredient_index
+from app.search import index_recipe, is_postgresql, unindex_recipe
+from users.models import User
+
+from .authentication import token_cache
+from .profiling import install_query_recorder
+from .recipe_cache import forget_recipes
+from .reference_cache import bump_version
+
+connection_created.connect(install_query_recorder)
+
+
+@receiver((post_save, post_delete), sender=Ingredient)
+def ingredients_changed(sender, **kwargs):
+    ingredient_index.invalidate()
+    bump_version('ingredients')
+
+
+@receiver((post_save, post_delete), sender=Tag)
+def tags_changed(sender, **kwargs):
+    bump_version('tags')
+
+
+@receiver((post_save, pre_delete), sender=Ingredient)
+def touch_ingredient_recipes(sender, instance, created=False, **kwargs):
+    if not created:
+        Recipe.objects.filter(ingredients=instance).touch()
+
+
+@receiver(post_save, sender=Tag)
+def touch_tag_recipes(sender, instance, created, **kwargs):
+    if not created:
+        Recipe.objects.filter(tags=instance).touch()
+
+
+@receiver(pre_delete, sender=Tag)
+def drop_deleted_tag(sender, instance, **kwargs):
+    Recipe.objects.drop_tag(instance)
+
+
+@receiver(post_save, sender=User)
+def touch_author_recipes(sender, instance, created, update_fields,
+                         **kwargs):
+    if not created and update_fields != frozenset(('last_login',)):
+        Recipe.objects.filter(author=instance).touch()
+
+
+@receiver(post_save, sender=User)
+def invalidate_user_tokens(sender, instance, created, update_fields,
+                           **kwargs):
+    if not created and update_fields != frozenset(('last_login',)):
+        token_cache.invalidate_user(instance.pk)
+
+
+@receiver(post_delete, sender=User)
+def forget_deleted_user(sender, instance, **kwargs):
+    token_cache.invalidate_user(instance.pk)
+
+
+@receiver(post_delete, sender=Token)
+def forget_deleted_token(sender, instance, **kwargs):
+    token_cache.invalidate_token(instance.key)
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def sync_recipe_tags(sender, instance, action, reverse, pk_set, **kwargs):
+    if reverse and action == 'pre_clear':
+        Recipe.objects.drop_tag(instance)
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        Recipe.objects.filter(pk=instance.pk).sync_tag_mask()
+    elif pk_set:
+        Recipe.objects.filter(pk__in=pk_set).sync_tag_mask()
+
+
+@receiver(pre_delete, sender=ShoppingCart)
+def remove_cart_from_shopping_list(sender, instance, **kwargs):
+    if not rebuilding_shopping_lists.get():
+        ShoppingListItem.objects.remove_recipe(instance.subscriber_id,
+                                               instance.recipe_id)
+
+
+@receiver(post_save, sender=Recipe)
+def index_recipe_text(sender, instance, using, update_fields, **kwargs):
+    if is_postgresql(using):
+        return
+    if update_fields is None or {'name', 'text'} & update_fields:
+        index_recipe(instance, using)
+
+
+@receiver(post_delete, sender=Recipe)
+def unindex_recipe_text(sender, instance, using, **kwargs):
+    if not is_postgresql(using):
+        unindex_recipe(instance, using)
+
+
+@receiver((post_save, post_delete), sender=Recipe)
+def forget_recipe_fragment(sender, instance, using, created=False,
+                           **kwargs):
+    if not created:
+        forget_recipes([instance.pk], using)
+
+
+@receiver((post_save, post_delete), sender=IngredientAmount)
+def forget_ingredients_fragment(sender, instance, using, **kwargs):
+    forget_recipes([instance.recipe_id], using)
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def forget_tags_fragments(sender, instance, action, reverse, pk_set, using,
+                          **kwargs):
+    if reverse and action == 'pre_clear':
+        forget_recipes(
+            instance.recipes.values_list('pk', flat=True), using)
+    elif action in ('post_add', 'post_remove', 'post_clear'):
+        forget_recipes((pk_set or ()) if reverse else [instance.pk], using)
+
+
+@receiver(post_save, sender=User)
+def forget_author_fragments(sender, instance, created, update_fields,
+                            using, **kwargs):
+    if not created and update_fields != frozenset(('last_login',)):
+        forget_recipes(Recipe.objects.filter(
+            author=instance).values_list('pk', flat=True), using)
@@ -0,0 +1,342 @@
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from django.db.models import prefetch_related_objects
+from django.test import TestCase
+from rest_framework.authtoken.models import Token
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIClient, APIRequestFactory
+
+from api.authentication import token_cache
+from api.fast_serializers import serialize_recipes
+from api.serializers import RecipeGetSerializer, RecipePostSerializer
+
+from app.models import (TAG_MASK_BITS, Favorite, Ingredient, IngredientAmount,
+                        Recipe, ShoppingCart, Tag, recipe_prefetches)
+from users.models import Follow, User
+
+
+class RecipeQueriesTest(TestCase):
+    """Число запросов к базе не зависит от числа рецептов на странице"""
+
+    @classmethod
+    def setUpTestData(cls):
+        authors = [User.objects.create_user(
+            email=f'author{i}@test.ru', username=f'author{i}', password='p',
+            first_name='Имя', last_name='Фамилия') for i in range(5)]
+        cls.user = authors[0]
+        tags = [Tag.objects.create(name=f'Тег {i}', color=f'#00000{i}',
+                                   slug=f'tag{i}') for i in range(3)]
+        ingredients = Ingredient.objects.bulk_create(
+            Ingredient(name=f'Ингредиент {i}', measurement_unit='г')
+            for i in range(20))
+        ingredients = list(Ingredient.objects.all())
+        for i in range(120):
+            recipe = Recipe.objects.create(
+                author=authors[i % 5], name=f'Рецепт {i}', text='Описание',
+                cooking_time=5)
+            recipe.tags.set(tags[:1 + i % 3])
+            IngredientAmount.objects.bulk_create(
+                IngredientAmount(recipe=recipe,
+                                 ingredients=ingredients[(i + j) % 20],
+                                 amount=j + 1)
+                for j in range(3))
+            if i % 3 == 0:
+                Favorite.objects.create(subscriber=cls.user, recipe=recipe)
+                ShoppingCart.objects.create(subscriber=cls.user,
+                                            recipe=recipe)
+        Follow.objects.create(user=cls.user, author=authors[1])
+        cls.recipe = Recipe.objects.order_by('-pk').first()
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.clients = {'anonymous': APIClient(), 'user': self.client}
+
+    def assert_queries(self, client, url, count):
+        with self.assertNumQueries(count):
+            response = client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def test_list(self):
+        for name, client in self.clients.items():
+            for limit in (6, 100):
+                cache.clear()
+                with self.subTest(client=name, limit=limit):
+                    response = self.assert_queries(
+                        client, f'/api/recipes/?limit={limit}', 4)
+                    self.assertEqual(len(response.data['results']), limit)
+
+    def test_list_cached_fragments(self):
+        self.assert_queries(self.client, '/api/recipes/?limit=100', 4)
+        self.assert_queries(self.client, '/api/recipes/?limit=100', 2)
+
+    def test_retrieve(self):
+        url = f'/api/recipes/{self.recipe.pk}/'
+        for name, client in self.clients.items():
+            cache.clear()
+            with self.subTest(client=name):
+                response = self.assert_queries(client, url, 3)
+                self.assertEqual(len(response.data['ingredients']), 3)
+                self.assertEqual(len(response.data['tags']),
+                                 len(self.recipe.tags.all()))
+
+
+class TokenCacheTest(TestCase):
+    """Изменяющие запросы не получают пользователя из кэша токенов"""
+
+    def setUp(self):
+        token_cache.clear()
+        self.user = User.objects.create_user(
+            email='user@test.ru', username='user', password='Pass-12345',
+            first_name='Имя', last_name='Фамилия')
+        self.client = APIClient()
+        self.client.credentials(
+            HTTP_AUTHORIZATION=f'Token {Token.objects.create(user=self.user)}')
+        self.assertEqual(self.client.get('/api/users/me/').status_code, 200)
+
+    def test_deactivated_user_cannot_write(self):
+        User.objects.filter(pk=self.user.pk).update(is_active=False)
+        response = self.client.patch(
+            '/api/users/me/', {'first_name': 'Другое'}, format='json')
+        self.assertEqual(response.status_code, 401)
+        self.assertFalse(User.objects.get(pk=self.user.pk).is_active)
+
+    def test_set_password_keeps_counters(self):
+        follower = User.objects.create_user(
+            email='follower@test.ru', username='follower', password='p',
+            first_name='Имя', last_name='Фамилия')
+        Follow.objects.add_author(follower, self.user.pk)
+        response = self.client.post('/api/users/set_password/', {
+            'current_password': 'Pass-12345',
+            'new_password': 'Other-12345'}, format='json')
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(User.objects.get(pk=self.user.pk).followers_count, 1)
+
+
+class CounterFieldsTest(TestCase):
+    """Сохранение устаревшего объекта не затирает счётчики"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author, cls.subscriber = [User.objects.create_user(
+            email=f'{name}@test.ru', username=name, password='p',
+            first_name='Имя', last_name='Фамилия')
+            for name in ('author', 'subscriber')]
+        cls.recipe = Recipe.objects.create(
+            author=cls.author, name='Рецепт', text='Описание',
+            cooking_time=5)
+        cls.tag = Tag.objects.create(name='Тег', color='#000000', slug='tag')
+        cls.ingredient = Ingredient.objects.create(
+            name='Ингредиент', measurement_unit='г')
+
+    def test_recipe_update_after_favorite(self):
+        stale = Recipe.objects.get(pk=self.recipe.pk)
+        Favorite.objects.add_recipe(self.subscriber, self.recipe.pk)
+        request = APIRequestFactory().patch('/')
+        request.user = self.author
+        serializer = RecipePostSerializer(
+            stale, data={
+                'name': 'Новое название', 'text': 'Описание',
+                'cooking_time': 5, 'tags': [self.tag.pk],
+                'ingredients': [{'id': self.ingredient.pk, 'amount': 10}]},
+            partial=True, context={'request': request})
+        serializer.is_valid(raise_exception=True)
+        serializer.save()
+        recipe = Recipe.objects.get(pk=self.recipe.pk)
+        self.assertEqual(recipe.name, 'Новое название')
+        self.assertEqual(recipe.favorites_count, 1)
+
+    def test_user_save_after_follow(self):
+        stale = User.objects.get(pk=self.author.pk)
+        Follow.objects.add_author(self.subscriber, self.author.pk)
+        stale.first_name = 'Другое'
+        stale.save()
+        author = User.objects.get(pk=self.author.pk)
+        self.assertEqual(author.first_name, 'Другое')
+        self.assertEqual(author.followers_count, 1)
+
+
+class RecipeValidationTest(TestCase):
+    """Ошибки ингредиентов возвращаются по каждому элементу"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            email='author@test.ru', username='author', password='p',
+            first_name='Имя', last_name='Фамилия')
+        cls.tag = Tag.objects.create(name='Тег', color='#000000', slug='tag')
+        cls.ingredient = Ingredient.objects.create(
+            name='Ингредиент', measurement_unit='г')
+
+    def test_ingredient_errors(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        response = client.post('/api/recipes/', {
+            'name': 'Рецепт', 'text': 'Описание', 'cooking_time': 5,
+            'tags': [self.tag.pk],
+            'ingredients': [
+                {'id': '²', 'amount': 1},
+                {'id': 'abc', 'amount': 1},
+                {'id': self.ingredient.pk, 'amount': 0},
+                {'id': self.ingredient.pk + 1000, 'amount': 1},
+                {'id': self.ingredient.pk, 'amount': 1},
+            ]}, format='json')
+        self.assertEqual(response.status_code, 400)
+        errors = response.data['ingredients']
+        self.assertEqual([sorted(error) for error in errors],
+                         [['id'], ['id'], ['amount'], ['id'], ['id']])
+
+
+class RecipesLimitTest(TestCase):
+    """recipes_limit, не являющийся числом, не ограничивает рецепты"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user, cls.author, cls.other = [User.objects.create_user(
+            email=f'{name}@test.ru', username=name, password='p',
+            first_name='Имя', last_name='Фамилия')
+            for name in ('user', 'author', 'other')]
+        for author in (cls.author, cls.other):
+            for i in range(3):
+                Recipe.objects.create(author=author, name=f'Рецепт {i}',
+                                      text='Описание', cooking_time=5)
+        Follow.objects.add_author(cls.user, cls.author.pk)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_subscriptions(self):
+        for limit, expected in (('1', 1), ('²', 3), ('abc', 3)):
+            with self.subTest(limit=limit):
+                response = self.client.get(
+                    '/api/users/subscriptions/', {'recipes_limit': limit})
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(
+                    len(response.data['results'][0]['recipes']), expected)
+
+    def test_subscribe(self):
+        response = self.client.post(
+            f'/api/users/{self.other.pk}/subscribe/?recipes_limit=²')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(response.data['recipes']), 3)
+
+
+class FastSerializerParityTest(TestCase):
+    """serialize_recipes отдаёт тот же JSON, что RecipeGetSerializer"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user, cls.author, cls.other = [User.objects.create_user(
+            email=f'{name}@test.ru', username=name, password='p',
+            first_name='Имя', last_name='Фамилия')
+            for name in ('user', 'author', 'other')]
+        tags = [Tag.objects.create(name=f'Тег {i}', color=f'#00000{i}',
+                                   slug=f'tag{i}') for i in range(2)]
+        ingredient = Ingredient.objects.create(
+            name='Ингредиент', measurement_unit='г')
+        recipes = []
+        for i, author in enumerate((cls.author, cls.author, cls.other)):
+            recipe = Recipe.objects.create(
+                author=author, name=f'Рецепт {i}', text='Описание',
+                cooking_time=5 + i)
+            recipe.tags.set(tags[:i + 1])
+            IngredientAmount.objects.create(
+                recipe=recipe, ingredients=ingredient, amount=10 * (i + 1))
+            recipes.append(recipe)
+        Recipe.objects.filter(pk=recipes[0].pk).update(
+            image='recipes/images/test.png',
+            thumbnail='recipes/thumbnails/test.webp',
+            image_webp='recipes/webp/test.webp')
+        Follow.objects.add_author(cls.user, cls.author.pk)
+        Favorite.objects.add_recipe(cls.user, recipes[0].pk)
+        ShoppingCart.objects.add_recipe(cls.user, recipes[1].pk)
+
+    def setUp(self):
+        cache.clear()
+
+    def payloads(self, user):
+        request = Request(APIRequestFactory().get('/api/recipes/'))
+        request.user = user
+        queryset = Recipe.objects.with_user_flags(user).select_related(
+            'author').defer('search_vector').order_by('pk')
+        recipes = list(queryset)
+        prefetch_related_objects(recipes, *recipe_prefetches())
+        drf = RecipeGetSerializer(
+            recipes, many=True, context={'request': request}).data
+        fast = serialize_recipes(list(queryset), request)
+        renderer = JSONRenderer()
+        self.assertEqual(renderer.render(fast), renderer.render(drf))
+        return fast
+
+    def test_anonymous(self):
+        data = self.payloads(AnonymousUser())
+        self.assertFalse(any(
+            recipe['is_favorited'] or recipe['is_in_shopping_cart']
+            or recipe['author']['is_subscribed'] for recipe in data))
+        self.assertEqual(data[0]['image'],
+                         'http://testserver/media/recipes/images/test.png')
+
+    def test_authenticated(self):
+        data = self.payloads(self.user)
+        self.assertEqual(
+            [(recipe['is_favorited'], recipe['is_in_shopping_cart'],
+              recipe['author']['is_subscribed']) for recipe in data],
+            [(True, False, True), (False, True, True),
+             (False, False, False)])
+        for field, path in (('image', 'images/test.png'),
+                            ('thumbnail', 'thumbnails/test.webp'),
+                            ('image_webp', 'webp/test.webp')):
+            self.assertEqual(data[0][field],
+                             f'http://testserver/media/recipes/{path}')
+            self.assertIsNone(data[1][field])
+
+
+class RecipeSearchPaginationTest(TestCase):
+    """Курсорный режим не отменяет порядок по релевантности поиска"""
+
+    @classmethod
+    def setUpTestData(cls):
+        author = User.objects.create_user(
+            email='author@test.ru', username='author', password='p',
+            first_name='Имя', last_name='Фамилия')
+        cls.best = Recipe.objects.create(
+            author=author, name='Борщ', text='Борщ со сметаной, борщ',
+            cooking_time=5)
+        for i in range(3):
+            Recipe.objects.create(
+                author=author, name=f'Суп {i}',
+                text='Долгое описание супа, в конце подать как борщ',
+                cooking_time=5)
+
+    def test_cursor_with_search(self):
+        client = APIClient()
+        ranked = client.get('/api/recipes/', {'search': 'борщ'}).data
+        self.assertEqual(ranked['results'][0]['id'], self.best.pk)
+        response = client.get('/api/recipes/', {
+            'search': 'борщ', 'pagination': 'cursor', 'limit': 2})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['count'], 4)
+        self.assertEqual([recipe['id'] for recipe in response.data['results']],
+                         [recipe['id'] for recipe in ranked['results'][:2]])
+        self.assertIn('page=2', response.data['next'])
+
+
+class TagLimitTest(TestCase):
+    """Тег сверх числа битов маски отклоняется с ошибкой 400"""
+
+    def test_no_free_bit(self):
+        for i in range(TAG_MASK_BITS):
+            Tag.objects.create(name=f'Тег {i}', color=f'#{i:06}',
+                               slug=f'tag{i}')
+        client = APIClient()
+        client.force_authenticate(User.objects.create_user(
+            email='user@test.ru', username='user', password='p',
+            first_name='Имя', last_name='Фамилия'))
+        response = client.post('/api/tags/', {
+            'name': 'Лишний', 'color': '#ffffff', 'slug': 'extra'})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(Tag.objects.count(), TAG_MASK_BITS)
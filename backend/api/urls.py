@@ -1,6 +1,8 @@
+from django.conf import settings
 from django.urls import include, path
 from rest_framework.routers import DefaultRouter
 
+from .async_views import async_view
 from .views import (CustomUserViewset, IngredientViewSet, RecipeGetViewSet,
                     TagViewSet)
 
@@ -10,6 +12,15 @@ router.register('tags', TagViewSet)
 router.register('ingredients', IngredientViewSet)
 router.register('recipes', RecipeGetViewSet)
 
+# Эндпоинты, чьи GET и HEAD в ASGI-режиме работают в пуле потоков
+ASYNC_ROUTES = ('recipe-list', 'recipe-detail', 'tag-list', 'tag-detail',
+                'ingredient-list', 'ingredient-detail', 'user-subscriptions')
+
+if settings.ASYNC_VIEWS:
+    for route in router.urls:
+        if route.name in ASYNC_ROUTES:
+            route.callback = async_view(route.callback)
+
 
 urlpatterns = [
     path('', include(router.urls)),
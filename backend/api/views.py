@@ -1,25 +1,29 @@
-from django.db.models import Sum
-from django.http import HttpResponse
+from django.http import StreamingHttpResponse
 from django.shortcuts import get_object_or_404
 from djoser.views import UserViewSet
-from fpdf import FPDF
 from rest_framework import status, viewsets
 from rest_framework.decorators import action
-from rest_framework.filters import SearchFilter
+from rest_framework.exceptions import NotFound, ValidationError
 from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework.response import Response
+from rest_framework.settings import api_settings
 
+from app.ingredient_index import ingredient_index
 from app.models import Favorite, Ingredient, Recipe, ShoppingCart, Tag
 from users.models import Follow, User
 
+from .batch import batch_ids, batch_response, link_status
+from .conditional import conditional_response, recipe_validators
+from .exports import EXPORTERS, ExportNegotiation, get_shopping_list
+from .fast_serializers import serialize_recipes
 from .filters import CustomFilter
-from .paginations import CustomPagination
+from .paginations import CustomPagination, RecipePagination
 from .permissions import AuthorOrReadOnly
-from .serializers import (AddFavoriteSerializer, AddShoppingSerializer,
-                          CustomUserSerializer, FollowerCreateSerializer,
-                          FollowerListSerializer, IngredientSerializer,
-                          RecipeGetSerializer, RecipePostSerializer,
-                          RecipeSerializer, TagSerializer)
+from .reference_cache import ReferenceCacheMixin
+from .serializers import (CustomUserSerializer, FollowerListSerializer,
+                          IngredientSerializer, RecipeGetSerializer,
+                          RecipePostSerializer, RecipeSerializer,
+                          TagSerializer, recipes_limit)
 
 
 class CustomUserViewset(UserViewSet):
@@ -31,8 +35,13 @@ class CustomUserViewset(UserViewSet):
     @action(detail=False, url_path='subscriptions',
             permission_classes=(IsAuthenticated,))
     def subscriptions(self, request):
-        queryset = Follow.objects.filter(user=request.user)
+        queryset = Follow.objects.filter(
+            user=request.user).select_related('author').order_by('-id')
         page = self.paginate_queryset(queryset)
+        recipes = Recipe.objects.latest_by_author(
+            [follow.author_id for follow in page], recipes_limit(request))
+        for follow in page:
+            follow.latest_recipes = recipes[follow.author_id]
         serializer = FollowerListSerializer(page,
                                             many=True,
                                             context={'request': request})
@@ -42,110 +51,174 @@ class CustomUserViewset(UserViewSet):
         methods=['POST', 'DELETE'], detail=True,
         url_path='subscribe', permission_classes=(IsAuthenticated,))
     def subscribe(self, request, id):
+        user = request.user
+        if request.method == 'DELETE':
+            if not Follow.objects.remove_author(user, id):
+                raise NotFound()
+            return Response(status=status.HTTP_204_NO_CONTENT)
         author = get_object_or_404(User, pk=id)
+        if author == user:
+            raise ValidationError({api_settings.NON_FIELD_ERRORS_KEY: [
+                'Нельзя подписываться на себя']})
+        if not Follow.objects.add_author(user, author.pk):
+            raise ValidationError({api_settings.NON_FIELD_ERRORS_KEY: [
+                'Вы уже подписаны на этого автора']})
+        serializer = FollowerListSerializer(Follow(user=user, author=author),
+                                            context={'request': request})
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
+
+    @action(
+        methods=['POST', 'DELETE'], detail=False,
+        url_path='subscribe', permission_classes=(IsAuthenticated,))
+    def subscribe_batch(self, request):
         user = request.user
-        data = {}
-        data['author'] = author.pk
-        data['user'] = user.pk
-        if request.method == 'POST':
-            serializer = FollowerCreateSerializer(data=data)
-            serializer.is_valid(raise_exception=True)
-            obj, _ = Follow.objects.get_or_create(user=user, author=author)
-            serializer = FollowerListSerializer(obj,
-                                                context={'request': request})
-            return Response(serializer.data,
-                            status=status.HTTP_201_CREATED)
-        follow = get_object_or_404(Follow, user=user, author=author)
-        follow.delete()
-        return Response(status=status.HTTP_204_NO_CONTENT)
-
-
-class TagViewSet(viewsets.ModelViewSet):
+        ids = batch_ids(request)
+        linked = link_status(User.objects.all(),
+                             Follow.objects.filter(user=user), 'author', ids)
+        return batch_response(
+            request, ids, linked,
+            add=lambda author_ids: Follow.objects.add_authors(
+                user, author_ids),
+            remove=lambda author_ids: Follow.objects.remove_authors(
+                user, author_ids),
+            invalid={user.pk})
+
+
+class TagViewSet(ReferenceCacheMixin, viewsets.ModelViewSet):
+    reference_kind = 'tags'
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
     pagination_class = None
 
 
-class IngredientViewSet(viewsets.ModelViewSet):
+class IngredientViewSet(ReferenceCacheMixin, viewsets.ModelViewSet):
+    reference_kind = 'ingredients'
     queryset = Ingredient.objects.all()
     serializer_class = IngredientSerializer
     pagination_class = None
-    filter_backends = (SearchFilter,)
-    search_fields = ('^name',)
+
+    def list(self, request, *args, **kwargs):
+        name = request.query_params.get('name')
+        if name is None:
+            return self.cached_response(request, 'list',
+                                        ingredient_index.all)
+        return self.cached_response(
+            request, f'search:{name.strip().casefold()}',
+            lambda: ingredient_index.search(name))
 
 
 class RecipeGetViewSet(viewsets.ModelViewSet):
     queryset = Recipe.objects.all()
     permission_classes = (AuthorOrReadOnly,)
     serializer_class = RecipeGetSerializer
-    pagination_class = CustomPagination
+    pagination_class = RecipePagination
     filterset_class = CustomFilter
 
     def perform_create(self, serializer):
         serializer.save(author=self.request.user)
 
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action in ['list', 'retrieve']:
+            return queryset.with_user_flags(
+                self.request.user).select_related('author').defer(
+                    'search_vector')
+        return queryset
+
+    def list(self, request, *args, **kwargs):
+        page = self.paginate_queryset(
+            self.filter_queryset(self.get_queryset()))
+        meta = self.get_paginated_response([]).data
+
+        def build():
+            return self.get_paginated_response(
+                serialize_recipes(page, request))
+
+        # Удаление рецепта не сдвигает Last-Modified, поэтому только ETag
+        etag, _ = recipe_validators(page, list(meta.items()))
+        return conditional_response(request, etag, None, build)
+
+    def retrieve(self, request, *args, **kwargs):
+        instance = self.get_object()
+
+        def build():
+            return Response(serialize_recipes([instance], request)[0])
+
+        return conditional_response(
+            request, *recipe_validators([instance]), build)
+
     def get_serializer_class(self):
         if self.action in ['list', 'retrieve']:
             return RecipeGetSerializer
         return RecipePostSerializer
 
-    def add_delete_obj(self, request, pk, fav_shop_serializer,
-                       fav_shop_model):
-        recipe = get_object_or_404(Recipe, pk=pk)
-        user = self.request.user
-        data = {}
-        data['recipe'] = recipe.pk
-        data['subscriber'] = user.pk
-        if request.method == 'POST':
-            serializer = fav_shop_serializer(data=data,
-                                             context={'request': request})
-            serializer.is_valid(raise_exception=True)
-            serializer.save()
-            serializer = RecipeSerializer(recipe,
-                                          context={'request': request})
-            return Response(serializer.data,
-                            status=status.HTTP_201_CREATED)
-        obj = get_object_or_404(fav_shop_model, subscriber=user,
-                                recipe=recipe)
-        obj.delete()
-        return Response(status=status.HTTP_204_NO_CONTENT)
+    def add_delete_obj(self, request, pk, model, exists_message):
+        """Добавление одним INSERT, удаление одним DELETE"""
+        user = request.user
+        if request.method == 'DELETE':
+            if not model.objects.remove_recipe(user, pk):
+                raise NotFound()
+            return Response(status=status.HTTP_204_NO_CONTENT)
+        recipe = get_object_or_404(Recipe.objects.only(
+            'id', 'name', 'image', 'thumbnail', 'image_webp',
+            'cooking_time'), pk=pk)
+        if not model.objects.add_recipe(user, recipe.pk):
+            raise ValidationError(
+                {api_settings.NON_FIELD_ERRORS_KEY: [exists_message]})
+        serializer = RecipeSerializer(recipe, context={'request': request})
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
+
+    def batch_recipes(self, request, model):
+        """Пакетное добавление или удаление рецептов в избранное/корзину"""
+        user = request.user
+        ids = batch_ids(request)
+        linked = link_status(Recipe.objects.all(),
+                             model.objects.filter(subscriber=user),
+                             'recipe', ids)
+        return batch_response(
+            request, ids, linked,
+            add=lambda recipe_ids: model.objects.add_recipes(
+                user, recipe_ids),
+            remove=lambda recipe_ids: model.objects.remove_recipes(
+                user, recipe_ids))
 
     @action(
         methods=['POST', 'DELETE'], detail=True,
         url_path='favorite')
     def favorite(self, request, pk):
-        return self.add_delete_obj(request, pk,
-                                   fav_shop_serializer=AddFavoriteSerializer,
-                                   fav_shop_model=Favorite)
+        return self.add_delete_obj(request, pk, Favorite,
+                                   'Рецепт уже добавлен в избранное')
 
     @action(
         methods=['POST', 'DELETE'], detail=True,
         url_path='shopping_cart')
     def shopping_cart(self, request, pk):
-        return self.add_delete_obj(request, pk,
-                                   fav_shop_serializer=AddShoppingSerializer,
-                                   fav_shop_model=ShoppingCart)
+        return self.add_delete_obj(request, pk, ShoppingCart,
+                                   'Рецепт уже добавлен в cписок покупок')
+
+    @action(
+        methods=['POST', 'DELETE'], detail=False,
+        url_path='favorite', permission_classes=(IsAuthenticated,))
+    def favorite_batch(self, request):
+        return self.batch_recipes(request, Favorite)
+
+    @action(
+        methods=['POST', 'DELETE'], detail=False,
+        url_path='shopping_cart', permission_classes=(IsAuthenticated,))
+    def shopping_cart_batch(self, request):
+        return self.batch_recipes(request, ShoppingCart)
 
     @action(detail=False, url_path='download_shopping_cart',
-            permission_classes=(AuthorOrReadOnly,))
+            permission_classes=(IsAuthenticated,),
+            content_negotiation_class=ExportNegotiation)
     def download_shopping_cart(self, request):
-        pdf = FPDF(orientation="P", unit="mm", format="A4")
-        pdf.add_page()
-        pdf.add_font('DejaVu',
-                     fname='static/fonts/DejaVuSansMono.ttf', uni=True)
-        pdf.set_font('DejaVu', size=16)
-        shop = ShoppingCart.objects.filter(
-            subscriber=request.user).select_related('recipe').values(
-                'recipe__ingredients__name',
-                'recipe__ingredients__measurement_unit').annotate(
-                    amount=Sum('recipe__ingredient_amount'))
-        for i in shop:
-            pdf.cell(60, 20,
-                     f"{i['recipe__ingredients__name']} {i['amount']} "
-                     f"{i['recipe__ingredients__measurement_unit']}",
-                     new_x="LMARGIN", new_y="NEXT")
-        response = HttpResponse(
-            bytes(pdf.output()), content_type='application/pdf')
+        export_format = request.query_params.get('format', 'pdf')
+        if export_format not in EXPORTERS:
+            raise ValidationError({'format': [
+                f"Доступные форматы: {', '.join(EXPORTERS)}"]})
+        exporter = EXPORTERS[export_format](get_shopping_list(request.user))
+        response = StreamingHttpResponse(exporter.render(),
+                                         content_type=exporter.content_type)
         response['Content-Disposition'] = (
-            'attachment; filename="shopping_cart.pdf"')
+            f'attachment; filename="shopping_cart.{exporter.extension}"')
         return response
@@ -1,44 +1,126 @@
+from django.conf import settings
 from django.contrib import admin
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Case, When
+from django.utils.functional import cached_property
 
 from users.models import Follow, User
 
+from .ingredient_index import ingredient_index
 from .models import (Favorite, Ingredient,
                      Recipe, ShoppingCart,
                      Tag, IngredientAmount)
 
 
+class EstimatedCountPaginator(Paginator):
+    """Число строк для больших таблиц без COUNT(*).
+
+    Для запросов без фильтров на PostgreSQL оно берётся из статистики
+    планировщика, если таблица не меньше ADMIN_ESTIMATED_COUNT_MIN строк.
+    """
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        connection = connections[queryset.db]
+        if connection.vendor == 'postgresql' and not queryset.query.where:
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    'SELECT reltuples FROM pg_class WHERE oid = %s::regclass',
+                    [queryset.model._meta.db_table])
+                estimate = int(cursor.fetchone()[0])
+            if estimate >= settings.ADMIN_ESTIMATED_COUNT_MIN:
+                return estimate
+        return super().count
+
+
+class LargeTableAdmin(admin.ModelAdmin):
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+
 class TagAdmin(admin.ModelAdmin):
     list_display = ('pk', 'name', 'color', 'slug')
 
 
 class IngredientAdmin(admin.ModelAdmin):
     list_display = ('pk', 'name', 'measurement_unit')
+    search_fields = ('^name',)
+
+    def get_search_results(self, request, queryset, search_term):
+        """Автодополнение ищет по индексу ингредиентов в памяти"""
+        match = request.resolver_match
+        if not search_term or match is None or (
+                match.url_name != 'autocomplete'):
+            return super().get_search_results(request, queryset, search_term)
+        ids = [row['id'] for row in ingredient_index.search(search_term)]
+        position = Case(*(When(pk=pk, then=index)
+                          for index, pk in enumerate(ids)))
+        return queryset.filter(pk__in=ids).order_by(position), False
 
 
 class IngredientAmountInLine(admin.TabularInline):
     model = Recipe.ingredients.through
+    autocomplete_fields = ('ingredients',)
     extra = 1
 
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('ingredients')
+
 
-class RecipeAdmin(admin.ModelAdmin):
-    list_display = ('pk', 'author', 'name', 'text', 'cooking_time')
+class RecipeAdmin(LargeTableAdmin):
+    list_display = ('pk', 'author', 'name', 'text', 'cooking_time',
+                    'favorites_count', 'in_carts_count')
+    list_select_related = ('author',)
     inlines = (IngredientAmountInLine,)
-    list_filter = ('tags', 'name')
+    list_filter = ('tags',)
+    search_fields = ('name',)
+    autocomplete_fields = ('author',)
 
+    def get_search_results(self, request, queryset, search_term):
+        if not search_term:
+            return queryset, False
+        return queryset.search(search_term), False
 
-class UserAdmin(admin.ModelAdmin):
-    list_display = ('email', 'username', 'first_name', 'last_name')
-    list_filter = ('email', 'username')
 
+class UserAdmin(LargeTableAdmin):
+    list_display = ('email', 'username', 'first_name', 'last_name',
+                    'recipes_count', 'followers_count')
+    list_filter = ('is_staff', 'is_active')
+    search_fields = ('^email', '^username')
+    ordering = ('-id',)
 
-class IngredientAmountAdmin(admin.ModelAdmin):
+
+class IngredientAmountAdmin(LargeTableAdmin):
     list_display = ('recipe', 'ingredients', 'amount')
+    list_select_related = ('recipe', 'ingredients')
+    raw_id_fields = ('recipe',)
+    autocomplete_fields = ('ingredients',)
+
+
+class FollowAdmin(LargeTableAdmin):
+    list_display = ('pk', 'user', 'author')
+    list_select_related = ('user', 'author')
+    raw_id_fields = ('user', 'author')
+
+
+class FavoriteAdmin(LargeTableAdmin):
+    list_display = ('pk', 'subscriber', 'recipe')
+    list_select_related = ('subscriber', 'recipe')
+    raw_id_fields = ('subscriber', 'recipe')
+
+
+class ShoppingCartAdmin(LargeTableAdmin):
+    list_display = ('pk', 'subscriber', 'recipe')
+    list_select_related = ('subscriber', 'recipe')
+    raw_id_fields = ('subscriber', 'recipe')
 
 
 admin.site.register(User, UserAdmin)
-admin.site.register(Follow)
-admin.site.register(Favorite)
-admin.site.register(ShoppingCart)
+admin.site.register(Follow, FollowAdmin)
+admin.site.register(Favorite, FavoriteAdmin)
+admin.site.register(ShoppingCart, ShoppingCartAdmin)
 admin.site.register(Recipe, RecipeAdmin)
 admin.site.register(Ingredient, IngredientAdmin)
 admin.site.register(Tag, TagAdmin)
@@ -0,0 +1,77 @@
+import io
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connections, transaction
+from django.utils import timezone
+from PIL import Image
+
+from .models import Recipe
+
+logger = logging.getLogger(__name__)
+
+VARIANTS = {
+    'thumbnail': ('recipes/thumbnails/', settings.RECIPE_THUMBNAIL_SIZE),
+    'image_webp': ('recipes/webp/', settings.RECIPE_WEBP_SIZE),
+}
+
+executor = ThreadPoolExecutor(max_workers=max(settings.IMAGE_WORKERS, 1),
+                              thread_name_prefix='recipe-images')
+
+
+def render_variant(image, size):
+    variant = image.copy()
+    variant.thumbnail(size)
+    buffer = io.BytesIO()
+    variant.save(buffer, format='WEBP', quality=80)
+    return buffer.getvalue()
+
+
+def process_recipe_image(recipe_id):
+    """Создать миниатюру и WebP-версию картинки рецепта.
+
+    Имена вариантов строятся по хэшу оригинала, поэтому одинаковые
+    картинки обрабатываются один раз.
+    """
+    recipe = Recipe.objects.filter(pk=recipe_id).only(
+        'image', 'image_hash').first()
+    if recipe is None or not recipe.image or not recipe.image_hash:
+        return
+    with recipe.image.open('rb') as file:
+        image = Image.open(file)
+        image.load()
+    if image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA')
+    names = {}
+    for field, (prefix, size) in VARIANTS.items():
+        name = f'{prefix}{recipe.image_hash}.webp'
+        if not default_storage.exists(name):
+            name = default_storage.save(
+                name, ContentFile(render_variant(image, size)))
+        names[field] = name
+    Recipe.objects.filter(pk=recipe_id, image_hash=recipe.image_hash).update(
+        updated_at=timezone.now(), **names)
+
+
+def run_in_worker(recipe_id):
+    try:
+        process_recipe_image(recipe_id)
+    except Exception:
+        logger.exception('Не удалось обработать картинку рецепта %s',
+                         recipe_id)
+    finally:
+        connections.close_all()
+
+
+def schedule_image_processing(recipe_id):
+    """Обработать картинку после коммита, в фоновом потоке.
+
+    При IMAGE_WORKERS = 0 обработка идёт сразу, в текущем потоке.
+    """
+    if not settings.IMAGE_WORKERS:
+        transaction.on_commit(lambda: process_recipe_image(recipe_id))
+        return
+    transaction.on_commit(lambda: executor.submit(run_in_worker, recipe_id))
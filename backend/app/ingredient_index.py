@@ -0,0 +1,65 @@
+import heapq
+import sys
+import threading
+import time
+from bisect import bisect_left
+
+from django.conf import settings
+
+from .models import Ingredient
+
+
+class IngredientIndex:
+    """Префиксный индекс ингредиентов в памяти процесса.
+
+    Строится лениво из таблицы Ingredient, сбрасывается сигналами при
+    изменении ингредиентов и по истечении INGREDIENT_INDEX_TTL, чтобы
+    подхватывать изменения, сделанные в других процессах.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._data = None
+
+    def invalidate(self):
+        self._data = None
+
+    def _load(self):
+        data = self._data
+        if data is not None and time.monotonic() < data[2]:
+            return data
+        with self._lock:
+            data = self._data
+            if data is None or time.monotonic() >= data[2]:
+                rows = list(Ingredient.objects.values(
+                    'id', 'name', 'measurement_unit'))
+                entries = sorted(
+                    (row['name'].casefold(), row['id'], row) for row in rows)
+                data = ([entry[0] for entry in entries],
+                        [entry[2] for entry in entries],
+                        time.monotonic() + settings.INGREDIENT_INDEX_TTL)
+                self._data = data
+        return data
+
+    def all(self):
+        _, rows, _ = self._load()
+        return sorted(rows, key=lambda row: row['id'], reverse=True)
+
+    def search(self, prefix, limit=None):
+        """Ингредиенты, название которых начинается с prefix.
+
+        Сначала точное совпадение, затем более короткие названия,
+        затем по алфавиту.
+        """
+        keys, rows, _ = self._load()
+        prefix = prefix.strip().casefold()
+        limit = limit or settings.INGREDIENT_SEARCH_LIMIT
+        start = bisect_left(keys, prefix)
+        end = bisect_left(keys, prefix + chr(sys.maxunicode), start)
+        best = heapq.nsmallest(
+            limit, range(start, end),
+            key=lambda i: (keys[i] != prefix, len(keys[i]), keys[i]))
+        return [rows[i] for i in best]
+
+
+ingredient_index = IngredientIndex()
@@ -1,17 +1,72 @@
-from django.core.management.base import BaseCommand
+import csv
+import json
+import os
+import time
+from itertools import islice
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
 
 from app.models import Ingredient
 
-import csv
+DEFAULT_PATH = os.path.join(settings.BASE_DIR, 'app', 'data',
+                            'ingredients.csv')
+
+
+def read_csv(file):
+    for row in csv.reader(file):
+        if row:
+            name, unit = row
+            yield name, unit
+
+
+def read_json(file):
+    for item in json.load(file):
+        yield item['name'], item['measurement_unit']
+
+
+def chunked(rows, size):
+    rows = iter(rows)
+    while True:
+        batch = list(islice(rows, size))
+        if not batch:
+            return
+        yield batch
+
+
+READERS = {'.csv': read_csv, '.json': read_json}
 
 
 class Command(BaseCommand):
     help = 'load custom data'
 
+    def add_arguments(self, parser):
+        parser.add_argument('path', nargs='?', default=DEFAULT_PATH,
+                            help='CSV или JSON файл с ингредиентами')
+        parser.add_argument('--batch-size', type=int, default=1000)
+
     def handle(self, *args, **options):
-        with open('app/data/ingredients.csv') as file:
-            file_reader = csv.reader(file)
-            for row in file_reader:
-                name, unit = row
-                Ingredient.objects.get_or_create(name=name,
-                                                 measurement_unit=unit)
+        path = options['path']
+        reader = READERS.get(os.path.splitext(path)[1].lower())
+        if reader is None:
+            raise CommandError('Поддерживаются только файлы .csv и .json')
+        start = time.perf_counter()
+        total = created = 0
+        with open(path, encoding='utf-8') as file, transaction.atomic():
+            existing = set(Ingredient.objects.values_list(
+                'name', 'measurement_unit'))
+            for batch in chunked(reader(file), options['batch_size']):
+                total += len(batch)
+                new = []
+                for row in batch:
+                    if row not in existing:
+                        existing.add(row)
+                        new.append(Ingredient(name=row[0],
+                                              measurement_unit=row[1]))
+                Ingredient.objects.bulk_create(new, ignore_conflicts=True)
+                created += len(new)
+        elapsed = time.perf_counter() - start
+        self.stdout.write(self.style.SUCCESS(
+            f'Прочитано {total}, добавлено {created} за {elapsed:.2f} с '
+            f'({total / elapsed:.0f} строк/с)'))
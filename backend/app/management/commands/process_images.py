@@ -0,0 +1,34 @@
+import hashlib
+
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+
+from app.images import process_recipe_image
+from app.models import Recipe
+
+
+class Command(BaseCommand):
+    help = 'Создать миниатюры и WebP-версии картинок рецептов'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true',
+                            help='Обработать все картинки, а не только новые')
+
+    def handle(self, *args, **options):
+        recipes = Recipe.objects.exclude(
+            Q(image='') | Q(image__isnull=True)).only('image', 'image_hash')
+        if not options['all']:
+            recipes = recipes.filter(
+                Q(image_hash='') | Q(thumbnail='') | Q(thumbnail__isnull=True)
+                | Q(image_webp='') | Q(image_webp__isnull=True))
+        processed = 0
+        for recipe in recipes.iterator():
+            if not recipe.image_hash:
+                with recipe.image.open('rb') as file:
+                    recipe.image_hash = hashlib.sha256(file.read()).hexdigest()
+                Recipe.objects.filter(pk=recipe.pk).update(
+                    image_hash=recipe.image_hash)
+            process_recipe_image(recipe.pk)
+            processed += 1
+        self.stdout.write(self.style.SUCCESS(
+            f'Обработано картинок: {processed}'))
@@ -0,0 +1,45 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from app.models import ShoppingCart, ShoppingListItem
+
+
+class Command(BaseCommand):
+    help = 'Пересчитать или проверить суммарные списки покупок'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--check', action='store_true',
+                            help='Только проверить, ничего не меняя')
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help='Пользователей за одну транзакцию')
+
+    def handle(self, *args, **options):
+        users = list(ShoppingCart.objects.values_list(
+            'subscriber', flat=True).distinct().order_by('subscriber'))
+        users += ShoppingListItem.objects.exclude(
+            user__in=users).values_list('user', flat=True).distinct()
+        mismatched = 0
+        for start in range(0, len(users), options['batch_size']):
+            batch = users[start:start + options['batch_size']]
+            if options['check']:
+                mismatched += self.compare(batch)
+                continue
+            with transaction.atomic():
+                ShoppingListItem.objects.rebuild(users=batch)
+        if not options['check']:
+            self.stdout.write(self.style.SUCCESS(
+                f'Списки покупок пересчитаны для {len(users)} пользователей'))
+            return
+        if mismatched:
+            raise CommandError(f'Расхождений в списках покупок: {mismatched}')
+        self.stdout.write(self.style.SUCCESS('Списки покупок актуальны'))
+
+    def compare(self, users):
+        expected = {(user, ingredient): total for user, ingredient, total
+                    in ShoppingListItem.objects.totals(users)}
+        actual = {(user, ingredient): total for user, ingredient, total
+                  in ShoppingListItem.objects.filter(
+                      user__in=users).values_list(
+                          'user', 'ingredient', 'total_amount')}
+        return sum(1 for key in expected.keys() | actual.keys()
+                   if expected.get(key) != actual.get(key))
@@ -0,0 +1,68 @@
+from functools import reduce
+from operator import or_
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import F, Max, Q
+
+from app.models import Favorite, Recipe, ShoppingCart
+from users.models import Follow, User, count_of
+
+# Модель со счётчиками → {счётчик: (модель строк, поле связи)}
+COUNTERS = {
+    Recipe: {
+        'favorites_count': (Favorite, 'recipe'),
+        'in_carts_count': (ShoppingCart, 'recipe'),
+    },
+    User: {
+        'recipes_count': (Recipe, 'author'),
+        'followers_count': (Follow, 'author'),
+    },
+}
+
+
+class Command(BaseCommand):
+    help = 'Сверить счётчики избранного, корзин, рецептов и подписчиков'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--check', action='store_true',
+                            help='Только проверить, ничего не меняя')
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Строк за одну транзакцию')
+
+    def handle(self, *args, **options):
+        drifted = 0
+        for model, counters in COUNTERS.items():
+            found = self.reconcile(model, counters, options)
+            drifted += found
+            if found:
+                self.stdout.write(
+                    f'{model._meta.verbose_name_plural}: расхождений {found}')
+        if options['check'] and drifted:
+            raise CommandError(f'Расхождений в счётчиках: {drifted}')
+        if drifted:
+            self.stdout.write(self.style.SUCCESS(
+                f'Исправлено записей: {drifted}'))
+            return
+        self.stdout.write(self.style.SUCCESS('Счётчики актуальны'))
+
+    def reconcile(self, model, counters, options):
+        """Найти и пересчитать расходящиеся строки пачками по pk"""
+        actual = {f'actual_{name}': count_of(*source)
+                  for name, source in counters.items()}
+        drift = reduce(or_, (~Q(**{name: F(f'actual_{name}')})
+                             for name in counters))
+        last = model.objects.aggregate(last=Max('pk'))['last'] or 0
+        batch_size = options['batch_size']
+        drifted = 0
+        for start in range(0, last, batch_size):
+            with transaction.atomic():
+                stale = list(model.objects.filter(
+                    pk__gt=start, pk__lte=start + batch_size).annotate(
+                        **actual).filter(drift).values_list('pk', flat=True))
+                drifted += len(stale)
+                if stale and not options['check']:
+                    model.objects.filter(pk__in=stale).update(**{
+                        name: count_of(*source)
+                        for name, source in counters.items()})
+        return drifted
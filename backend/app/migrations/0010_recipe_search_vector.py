@@ -0,0 +1,66 @@
+# Generated by Django 3.2.13 on 2026-10-18 19:11
+
+import django.contrib.postgres.search
+from django.db import migrations
+
+POSTGRESQL_FORWARD = (
+    """
+    CREATE FUNCTION app_recipe_search_vector_update() RETURNS trigger AS $$
+    BEGIN
+        NEW.search_vector :=
+            setweight(to_tsvector('russian', coalesce(NEW.name, '')), 'A') ||
+            setweight(to_tsvector('russian', coalesce(NEW.text, '')), 'B');
+        RETURN NEW;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    """
+    CREATE TRIGGER app_recipe_search_vector_trigger
+    BEFORE INSERT OR UPDATE OF name, text ON app_recipe
+    FOR EACH ROW EXECUTE FUNCTION app_recipe_search_vector_update()
+    """,
+    'UPDATE app_recipe SET name = name',
+    'CREATE INDEX app_recipe_search_vector_gin ON app_recipe '
+    'USING gin (search_vector)',
+)
+POSTGRESQL_BACKWARD = (
+    'DROP INDEX IF EXISTS app_recipe_search_vector_gin',
+    'DROP TRIGGER IF EXISTS app_recipe_search_vector_trigger ON app_recipe',
+    'DROP FUNCTION IF EXISTS app_recipe_search_vector_update()',
+)
+FTS_FORWARD = (
+    'CREATE VIRTUAL TABLE app_recipe_fts USING fts5(name, text)',
+    'INSERT INTO app_recipe_fts (rowid, name, text) '
+    'SELECT id, name, text FROM app_recipe',
+)
+FTS_BACKWARD = ('DROP TABLE IF EXISTS app_recipe_fts',)
+
+
+def run_statements(postgresql, fallback):
+    def run(apps, schema_editor):
+        if schema_editor.connection.vendor == 'postgresql':
+            statements = postgresql
+        else:
+            statements = fallback
+        for statement in statements:
+            schema_editor.execute(statement)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0009_recipe_image_variants'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True, verbose_name='Поисковый вектор'),
+        ),
+        migrations.RunPython(
+            run_statements(POSTGRESQL_FORWARD, FTS_FORWARD),
+            run_statements(POSTGRESQL_BACKWARD, FTS_BACKWARD),
+        ),
+    ]
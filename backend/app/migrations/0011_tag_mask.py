@@ -0,0 +1,42 @@
+# Generated by Django 3.2.13 on 2026-10-18 19:40
+
+from django.db import migrations, models
+from django.db.models import F
+
+import app.models
+
+
+def fill_tag_masks(apps, schema_editor):
+    Tag = apps.get_model('app', 'Tag')
+    Recipe = apps.get_model('app', 'Recipe')
+    for bit, tag in enumerate(Tag.objects.order_by('id')):
+        tag.bit = bit
+        tag.save(update_fields=('bit',))
+        Recipe.objects.filter(tags=tag).update(
+            tag_mask=F('tag_mask').bitor(1 << bit))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0010_recipe_search_vector'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='tag',
+            name='bit',
+            field=models.PositiveSmallIntegerField(editable=False, null=True, verbose_name='Бит в маске тегов'),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='tag_mask',
+            field=app.models.TagMaskField(db_index=True, default=0, editable=False, verbose_name='Маска тегов'),
+        ),
+        migrations.RunPython(fill_tag_masks, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='tag',
+            name='bit',
+            field=models.PositiveSmallIntegerField(editable=False, unique=True, verbose_name='Бит в маске тегов'),
+        ),
+    ]
@@ -1,7 +1,24 @@
+from contextvars import ContextVar
+
+from django.contrib.postgres.search import SearchVectorField
+from django.core.exceptions import ValidationError
 from django.core.validators import MinValueValidator
-from django.db import models
+from django.db import models, transaction
+from django.utils import timezone
+from django.db.models import (BigIntegerField, Case, Exists, F, Lookup,
+                              OuterRef, Prefetch, Subquery, Sum, Value, When)
+from django.db.models.functions import Cast, Coalesce, Power
+
+from users.models import (CounterFieldsMixin, Follow, LinkQuerySet, User,
+                          count_of)
+
+from .search import search_recipes
 
-from users.models import User
+TAG_MASK_BITS = 63
+
+# Удалённые сейчас корзины не вычитаются из списка покупок: его пересоберут
+rebuilding_shopping_lists = ContextVar('rebuilding_shopping_lists',
+                                       default=False)
 
 
 class Tag(models.Model):
@@ -15,6 +32,9 @@ class Tag(models.Model):
     slug = models.CharField(
         max_length=150, unique=True,
         verbose_name='Слаг')
+    bit = models.PositiveSmallIntegerField(
+        unique=True, editable=False,
+        verbose_name='Бит в маске тегов')
 
     class Meta:
         ordering = ('-id',)
@@ -24,6 +44,45 @@ class Tag(models.Model):
     def __str__(self):
         return self.name
 
+    @property
+    def mask(self):
+        return 1 << self.bit
+
+    def save(self, *args, **kwargs):
+        if self.bit is None:
+            used = set(Tag.objects.values_list('bit', flat=True))
+            free = [bit for bit in range(TAG_MASK_BITS) if bit not in used]
+            if not free:
+                raise ValidationError(
+                    f'Нельзя создать больше {TAG_MASK_BITS} тегов')
+            self.bit = free[0]
+        super().save(*args, **kwargs)
+
+
+def tags_mask(tags):
+    """Битовая маска набора тегов"""
+    mask = 0
+    for tag in tags:
+        mask |= tag.mask
+    return mask
+
+
+class HasAnyBits(Lookup):
+    """field__hasany=mask: в поле выставлен хотя бы один бит маски"""
+    lookup_name = 'hasany'
+
+    def as_sql(self, compiler, connection):
+        lhs, lhs_params = self.process_lhs(compiler, connection)
+        rhs, rhs_params = self.process_rhs(compiler, connection)
+        return f'({lhs} & {rhs}) != 0', [*lhs_params, *rhs_params]
+
+
+class TagMaskField(models.BigIntegerField):
+    pass
+
+
+TagMaskField.register_lookup(HasAnyBits)
+
 
 class Ingredient(models.Model):
     name = models.CharField(
@@ -36,12 +95,89 @@ class Ingredient(models.Model):
         ordering = ('-id',)
         verbose_name = 'Ингредиент'
         verbose_name_plural = 'Ингредиенты'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['name', 'measurement_unit'],
+                name='unique_ingredient_unit'
+            )
+        ]
 
     def __str__(self):
         return self.name
 
 
-class Recipe(models.Model):
+def recipe_prefetches():
+    """Связи рецепта, нужные для полной сериализации"""
+    return (Prefetch('ingredient_amount',
+                     queryset=IngredientAmount.objects.select_related(
+                         'ingredients')),
+            'tags')
+
+
+class RecipeQuerySet(models.QuerySet):
+    """Выборка рецептов с данными для сериализации без N+1 запросов"""
+
+    def with_user_flags(self, user):
+        if not user.is_authenticated:
+            return self.annotate(is_favorited=Value(False),
+                                 is_in_shopping_cart=Value(False),
+                                 is_subscribed=Value(False))
+        return self.annotate(
+            is_favorited=Exists(Favorite.objects.filter(
+                subscriber=user, recipe=OuterRef('pk'))),
+            is_in_shopping_cart=Exists(ShoppingCart.objects.filter(
+                subscriber=user, recipe=OuterRef('pk'))),
+            is_subscribed=Exists(Follow.objects.filter(
+                user=user, author=OuterRef('author'))))
+
+    def touch(self):
+        """Отметить рецепты изменёнными, не загружая их"""
+        return self.update(updated_at=timezone.now())
+
+    def sync_tag_mask(self):
+        """Пересчитать маску тегов по связям и отметить рецепты изменёнными"""
+        masks = Tag.objects.filter(recipes=OuterRef('pk')).values(
+            'recipes').annotate(mask=Sum(Cast(
+                Power(2, 'bit'), BigIntegerField()))).values('mask')
+        return self.update(
+            tag_mask=Coalesce(Subquery(masks), 0),
+            updated_at=timezone.now())
+
+    def drop_tag(self, tag):
+        """Снять бит тега перед удалением связей с ним"""
+        return self.filter(tags=tag).update(
+            tag_mask=F('tag_mask').bitand(~tag.mask),
+            updated_at=timezone.now())
+
+    def search(self, text):
+        return search_recipes(self, text)
+
+    def latest_by_author(self, author_ids, limit=None):
+        """Последние limit рецептов каждого автора одним запросом"""
+        recipes = {author_id: [] for author_id in author_ids}
+        if not author_ids:
+            return recipes
+        if limit is None:
+            queryset = self.filter(author__in=author_ids).only(
+                'id', 'author_id', 'name', 'image', 'thumbnail',
+                'image_webp', 'cooking_time')
+        else:
+            placeholders = ', '.join(['%s'] * len(author_ids))
+            columns = ('id, author_id, name, image, thumbnail, image_webp, '
+                       'cooking_time')
+            queryset = self.raw(
+                f'SELECT {columns} FROM (SELECT {columns}, '
+                'ROW_NUMBER() OVER (PARTITION BY author_id ORDER BY id DESC) '
+                f'AS position FROM {self.model._meta.db_table} '
+                f'WHERE author_id IN ({placeholders})) AS ranked '
+                'WHERE position <= %s ORDER BY id DESC',
+                [*author_ids, limit])
+        for recipe in queryset:
+            recipes[recipe.author_id].append(recipe)
+        return recipes
+
+
+class Recipe(CounterFieldsMixin, models.Model):
     author = models.ForeignKey(
         User,
         on_delete=models.CASCADE,
@@ -58,12 +194,30 @@ class Recipe(models.Model):
     tags = models.ManyToManyField(
         Tag, related_name='recipes',
         verbose_name='Тег', db_index=True)
+    tag_mask = TagMaskField(
+        default=0, db_index=True, editable=False,
+        verbose_name='Маска тегов')
     image = models.ImageField(
         'Картинка',
         upload_to='recipes/images/',
         blank=True,
         null=True,
     )
+    image_hash = models.CharField(
+        max_length=64, blank=True, db_index=True,
+        verbose_name='SHA-256 картинки')
+    thumbnail = models.ImageField(
+        'Миниатюра',
+        upload_to='recipes/thumbnails/',
+        blank=True,
+        null=True,
+    )
+    image_webp = models.ImageField(
+        'Картинка WebP',
+        upload_to='recipes/webp/',
+        blank=True,
+        null=True,
+    )
     name = models.CharField(
         max_length=200, db_index=True,
         verbose_name='Название')
@@ -74,6 +228,21 @@ class Recipe(models.Model):
         validators=[
             MinValueValidator(1, 'Минимальное время приготовления 1 минута'),
         ])
+    updated_at = models.DateTimeField(
+        auto_now=True, db_index=True,
+        verbose_name='Дата изменения')
+    search_vector = SearchVectorField(
+        null=True, editable=False,
+        verbose_name='Поисковый вектор')
+    favorites_count = models.PositiveIntegerField(
+        default=0, editable=False,
+        verbose_name='В избранном')
+    in_carts_count = models.PositiveIntegerField(
+        default=0, editable=False,
+        verbose_name='В корзинах')
+
+    objects = RecipeQuerySet.as_manager()
+    counter_fields = ('favorites_count', 'in_carts_count')
 
     class Meta:
         ordering = ('-id',)
@@ -83,6 +252,21 @@ class Recipe(models.Model):
     def __str__(self):
         return self.name
 
+    def save(self, *args, **kwargs):
+        adding = self._state.adding
+        with transaction.atomic(savepoint=False):
+            super().save(*args, **kwargs)
+            if adding:
+                User.objects.filter(pk=self.author_id).update(
+                    recipes_count=F('recipes_count') + 1)
+
+    def delete(self, *args, **kwargs):
+        with transaction.atomic(savepoint=False):
+            User.objects.filter(
+                pk=self.author_id, recipes_count__gt=0).update(
+                recipes_count=F('recipes_count') - 1)
+            return super().delete(*args, **kwargs)
+
 
 class IngredientAmount(models.Model):
     recipe = models.ForeignKey(
@@ -114,6 +298,79 @@ class IngredientAmount(models.Model):
         return str(self.amount)
 
 
+class SubscriberRecipeQuerySet(LinkQuerySet):
+    """Добавление и удаление рецептов пользователя по одному и пакетами.
+
+    Счётчик рецепта меняется в той же транзакции. Пакетные методы
+    пересчитывают его по строкам связей, поэтому уже существующие и
+    отсутствующие id его не сдвигают.
+    """
+    counter = None
+
+    def add_recipe(self, user, recipe_id):
+        with transaction.atomic(savepoint=False):
+            added = self.insert_ignore(subscriber=user.pk, recipe=recipe_id)
+            if added:
+                Recipe.objects.filter(pk=recipe_id).update(
+                    **{self.counter: F(self.counter) + 1})
+        return added
+
+    def remove_recipe(self, user, recipe_id):
+        with transaction.atomic(savepoint=False):
+            removed, _ = self.filter(
+                subscriber=user, recipe=recipe_id).delete()
+            if removed:
+                Recipe.objects.filter(
+                    pk=recipe_id, **{f'{self.counter}__gt': 0}).update(
+                        **{self.counter: F(self.counter) - 1})
+        return bool(removed)
+
+    def add_recipes(self, user, recipe_ids):
+        with transaction.atomic(savepoint=False):
+            self.bulk_create(
+                [self.model(subscriber=user, recipe_id=pk)
+                 for pk in recipe_ids], ignore_conflicts=True)
+            self.recount(recipe_ids)
+
+    def remove_recipes(self, user, recipe_ids):
+        with transaction.atomic(savepoint=False):
+            self.filter(subscriber=user, recipe__in=recipe_ids).delete()
+            self.recount(recipe_ids)
+
+    def recount(self, recipe_ids):
+        Recipe.objects.filter(pk__in=recipe_ids).update(
+            **{self.counter: count_of(self.model, 'recipe')})
+
+
+class FavoriteQuerySet(SubscriberRecipeQuerySet):
+    counter = 'favorites_count'
+
+
+class ShoppingCartQuerySet(SubscriberRecipeQuerySet):
+    counter = 'in_carts_count'
+
+    def add_recipe(self, user, recipe_id):
+        with transaction.atomic(savepoint=False):
+            added = super().add_recipe(user, recipe_id)
+            if added:
+                ShoppingListItem.objects.add_recipe(user.pk, recipe_id)
+        return added
+
+    def add_recipes(self, user, recipe_ids):
+        with transaction.atomic(savepoint=False):
+            super().add_recipes(user, recipe_ids)
+            ShoppingListItem.objects.rebuild(users=[user.pk])
+
+    def remove_recipes(self, user, recipe_ids):
+        token = rebuilding_shopping_lists.set(True)
+        try:
+            with transaction.atomic(savepoint=False):
+                super().remove_recipes(user, recipe_ids)
+                ShoppingListItem.objects.rebuild(users=[user.pk])
+        finally:
+            rebuilding_shopping_lists.reset(token)
+
+
 class Favorite(models.Model):
     subscriber = models.ForeignKey(
         User,
@@ -128,6 +385,8 @@ class Favorite(models.Model):
         verbose_name='Избранное'
     )
 
+    objects = FavoriteQuerySet.as_manager()
+
     class Meta:
         ordering = ('-id',)
         constraints = [
@@ -137,6 +396,21 @@ class Favorite(models.Model):
             )
         ]
 
+    def save(self, *args, **kwargs):
+        adding = self._state.adding
+        with transaction.atomic(savepoint=False):
+            super().save(*args, **kwargs)
+            if adding:
+                Recipe.objects.filter(pk=self.recipe_id).update(
+                    favorites_count=F('favorites_count') + 1)
+
+    def delete(self, *args, **kwargs):
+        with transaction.atomic(savepoint=False):
+            Recipe.objects.filter(
+                pk=self.recipe_id, favorites_count__gt=0).update(
+                favorites_count=F('favorites_count') - 1)
+            return super().delete(*args, **kwargs)
+
 
 class ShoppingCart(models.Model):
     subscriber = models.ForeignKey(
@@ -152,6 +426,8 @@ class ShoppingCart(models.Model):
         verbose_name='Рецепт'
     )
 
+    objects = ShoppingCartQuerySet.as_manager()
+
     class Meta:
         ordering = ('-id',)
         constraints = [
@@ -163,3 +439,105 @@ class ShoppingCart(models.Model):
 
     def __str__(self):
         return self.recipe.name
+
+    def save(self, *args, **kwargs):
+        adding = self._state.adding
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            if adding:
+                ShoppingListItem.objects.add_recipe(self.subscriber_id,
+                                                    self.recipe_id)
+                Recipe.objects.filter(pk=self.recipe_id).update(
+                    in_carts_count=F('in_carts_count') + 1)
+
+    def delete(self, *args, **kwargs):
+        with transaction.atomic():
+            Recipe.objects.filter(
+                pk=self.recipe_id, in_carts_count__gt=0).update(
+                in_carts_count=F('in_carts_count') - 1)
+            return super().delete(*args, **kwargs)
+
+
+class ShoppingListQuerySet(models.QuerySet):
+    """Поддержка суммарного списка покупок в актуальном состоянии"""
+
+    def _apply(self, user_id, recipe_id, sign):
+        amounts = dict(IngredientAmount.objects.filter(
+            recipe=recipe_id).values_list('ingredients', 'amount'))
+        if not amounts:
+            return
+        self.bulk_create(
+            [ShoppingListItem(user_id=user_id, ingredient_id=ingredient,
+                              total_amount=0) for ingredient in amounts],
+            ignore_conflicts=True)
+        items = self.filter(user=user_id, ingredient__in=amounts)
+        items.update(total_amount=F('total_amount') + sign * Case(
+            *[When(ingredient=ingredient, then=Value(amount))
+              for ingredient, amount in amounts.items()],
+            output_field=models.IntegerField()))
+        items.filter(total_amount__lte=0).delete()
+
+    def add_recipe(self, user_id, recipe_id):
+        self._apply(user_id, recipe_id, 1)
+
+    def remove_recipe(self, user_id, recipe_id):
+        self._apply(user_id, recipe_id, -1)
+
+    def totals(self, users=None, ingredients=None):
+        """Суммы из корзин, посчитанные заново по IngredientAmount"""
+        # Условия задаются одним filter(), чтобы корзина джойнилась один раз
+        lookups = {'recipe__Shopping__isnull': False}
+        if users is not None:
+            lookups['recipe__Shopping__subscriber__in'] = users
+        if ingredients is not None:
+            lookups['ingredients__in'] = ingredients
+        return IngredientAmount.objects.filter(**lookups).values_list(
+            'recipe__Shopping__subscriber', 'ingredients'
+        ).annotate(total=Sum('amount')).order_by()
+
+    def rebuild(self, users=None, ingredients=None):
+        stale = self.all()
+        if users is not None:
+            stale = stale.filter(user__in=users)
+        if ingredients is not None:
+            stale = stale.filter(ingredient__in=ingredients)
+        totals = list(self.totals(users, ingredients))
+        stale.delete()
+        self.bulk_create(
+            ShoppingListItem(user_id=user, ingredient_id=ingredient,
+                             total_amount=total)
+            for user, ingredient, total in totals)
+
+
+class ShoppingListItem(models.Model):
+    """Суммарное количество ингредиента в корзине пользователя"""
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='shopping_list',
+        verbose_name='Пользователь'
+    )
+    ingredient = models.ForeignKey(
+        Ingredient,
+        on_delete=models.CASCADE,
+        related_name='shopping_list',
+        verbose_name='Ингредиент'
+    )
+    total_amount = models.IntegerField(
+        verbose_name='Количество',
+    )
+
+    objects = ShoppingListQuerySet.as_manager()
+
+    class Meta:
+        verbose_name = 'Позиция списка покупок'
+        verbose_name_plural = 'Список покупок'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'ingredient'],
+                name='unique_shopping_list_item'
+            )
+        ]
+
+    def __str__(self):
+        return str(self.total_amount)
@@ -0,0 +1,70 @@
+import re
+
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.db import connections
+from django.db.models import F
+
+SEARCH_CONFIG = 'russian'
+FTS_TABLE = 'app_recipe_fts'
+
+
+def is_postgresql(using):
+    return connections[using].vendor == 'postgresql'
+
+
+def fts_query(text):
+    """Запрос FTS5: каждое слово ищется как префикс, операторы экранированы"""
+    return ' '.join(f'"{word}"*' for word in re.findall(r'\w+', text))
+
+
+def search_recipes(queryset, text):
+    """Рецепты, подходящие под запрос, от самых релевантных.
+
+    На PostgreSQL используется хранимый tsvector с GIN-индексом, который
+    заполняет триггер, на остальных базах — теневая таблица FTS5.
+    """
+    if is_postgresql(queryset.db):
+        query = SearchQuery(text, config=SEARCH_CONFIG,
+                            search_type='websearch')
+        return queryset.filter(search_vector=query).annotate(
+            search_rank=SearchRank(F('search_vector'), query)
+        ).order_by('-search_rank', '-id')
+    terms = fts_query(text)
+    if not terms:
+        return queryset.none()
+    table = queryset.model._meta.db_table
+    return queryset.extra(
+        select={'search_rank': f'-bm25({FTS_TABLE}, 10.0, 1.0)'},
+        tables=[FTS_TABLE],
+        where=[f'{FTS_TABLE}.rowid = {table}.id', f'{FTS_TABLE} MATCH %s'],
+        params=[terms],
+    ).order_by('-search_rank', '-id')
+
+
+def index_recipe(recipe, using):
+    """Обновить строку рецепта в таблице FTS5"""
+    with connections[using].cursor() as cursor:
+        cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s',
+                       (recipe.pk,))
+        cursor.execute(
+            f'INSERT INTO {FTS_TABLE} (rowid, name, text) VALUES (%s, %s, %s)',
+            (recipe.pk, recipe.name, recipe.text))
+
+
+def unindex_recipe(recipe, using):
+    with connections[using].cursor() as cursor:
+        cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s',
+                       (recipe.pk,))
+
+
+def rebuild_search_index(using='default'):
+    """Перестроить таблицу FTS5 после массовой загрузки рецептов.
+
+    На PostgreSQL вектор поддерживает триггер, перестраивать нечего.
+    """
+    if is_postgresql(using):
+        return
+    with connections[using].cursor() as cursor:
+        cursor.execute(f'DELETE FROM {FTS_TABLE}')
+        cursor.execute(f'INSERT INTO {FTS_TABLE} (rowid, name, text) '
+                       'SELECT id, name, text FROM app_recipe')
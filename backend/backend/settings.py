@@ -30,6 +30,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'api.middleware.MetricsMiddleware',
+    'api.middleware.ProfilingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -122,10 +124,50 @@ REST_FRAMEWORK = {
     ],
 
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'api.authentication.CachedTokenAuthentication',
     ],
 }
 
+INGREDIENT_SEARCH_LIMIT = 20
+
+INGREDIENT_INDEX_TTL = 300
+
+REFERENCE_CACHE_TIMEOUT = 300
+
+RECIPE_FRAGMENT_TIMEOUT = 600
+
+ADMIN_ESTIMATED_COUNT_MIN = 100000
+
+BATCH_MAX_SIZE = int(os.getenv('BATCH_MAX_SIZE', 100))
+
+RECIPE_IMAGE_MAX_SIZE = 5 * 1024 * 1024
+
+RECIPE_THUMBNAIL_SIZE = (480, 480)
+
+RECIPE_WEBP_SIZE = (1600, 1600)
+
+IMAGE_WORKERS = int(os.getenv('IMAGE_WORKERS', 2))
+
+ASYNC_VIEWS = os.getenv('ASYNC_VIEWS', 'False') == 'True'
+
+ASYNC_ORM_WORKERS = int(os.getenv('ASYNC_ORM_WORKERS', 8))
+
+AUTH_TOKEN_CACHE_SIZE = 10000
+
+AUTH_TOKEN_CACHE_TTL = 60
+
+AUTH_TOKEN_SHARED_CACHE = os.getenv('AUTH_TOKEN_SHARED_CACHE')
+
+PROFILE_REQUESTS = os.getenv('PROFILE_REQUESTS', 'False') == 'True'
+
+PROFILE_SLOW_REQUEST_MS = int(os.getenv('PROFILE_SLOW_REQUEST_MS', 500))
+
+PROFILE_REPEATED_QUERIES = 3
+
+METRICS_ALLOWED_NETWORKS = os.getenv(
+    'METRICS_ALLOWED_NETWORKS',
+    '127.0.0.0/8,10.0.0.0/8,172.16.0.0/12,192.168.0.0/16').split(',')
+
 DJOSER = {
     'PERMISSIONS': {
         'user': ('rest_framework.permissions.AllowAny',),
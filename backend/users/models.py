@@ -1,17 +1,117 @@
 from django.contrib.auth.models import AbstractUser
-from django.db import models
+from django.db import connections, models, router, transaction
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
 
 
-class User(AbstractUser):
+class CounterFieldsMixin:
+    """Счётчики в counter_fields меняются только выражениями F().
+
+    save() существующей строки их не записывает, иначе загруженные ранее
+    значения затёрли бы изменения из параллельных запросов.
+    """
+    counter_fields = ()
+
+    def save(self, force_insert=False, force_update=False, using=None,
+             update_fields=None):
+        if update_fields is None and not (
+                force_insert or self._state.adding):
+            skipped = self.get_deferred_fields().union(self.counter_fields)
+            update_fields = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.attname not in skipped]
+        super().save(force_insert=force_insert, force_update=force_update,
+                     using=using, update_fields=update_fields)
+
+
+class User(CounterFieldsMixin, AbstractUser):
     """Кастомизированная модель юзера"""
     email = models.EmailField(unique=True)
+    recipes_count = models.PositiveIntegerField(
+        default=0, editable=False,
+        verbose_name='Число рецептов')
+    followers_count = models.PositiveIntegerField(
+        default=0, editable=False,
+        verbose_name='Число подписчиков')
     REQUIRED_FIELDS = ['username', 'first_name', 'last_name']
     USERNAME_FIELD = 'email'
+    counter_fields = ('recipes_count', 'followers_count')
 
     def __str__(self):
         return self.username
 
 
+def count_of(model, field):
+    """Число строк model, ссылающихся через field на строку запроса"""
+    return Coalesce(Subquery(model.objects.filter(
+        **{field: OuterRef('pk')}).order_by().values(field).annotate(
+            total=Count('pk')).values('total')), 0)
+
+
+class LinkQuerySet(models.QuerySet):
+    """Связи пользователя с объектами под уникальным ограничением"""
+
+    def insert_ignore(self, **values):
+        """INSERT ... ON CONFLICT DO NOTHING, True, если строка добавлена.
+
+        Повтор отсекает уникальное ограничение, а не проверка exists(),
+        поэтому двойной клик не создаёт дубль и не падает с ошибкой.
+        """
+        meta = self.model._meta
+        connection = connections[router.db_for_write(self.model)]
+        quote = connection.ops.quote_name
+        columns = ', '.join(quote(meta.get_field(name).column)
+                            for name in values)
+        placeholders = ', '.join(['%s'] * len(values))
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'INSERT INTO {quote(meta.db_table)} ({columns}) '
+                f'VALUES ({placeholders}) ON CONFLICT DO NOTHING',
+                list(values.values()))
+            return cursor.rowcount > 0
+
+
+class FollowQuerySet(LinkQuerySet):
+    """Подписка и отписка со счётчиком подписчиков автора.
+
+    Пакетные методы пересчитывают счётчик по строкам подписок, поэтому
+    уже существующие и отсутствующие id его не сдвигают.
+    """
+
+    def add_author(self, user, author_id):
+        with transaction.atomic(savepoint=False):
+            added = self.insert_ignore(user=user.pk, author=author_id)
+            if added:
+                User.objects.filter(pk=author_id).update(
+                    followers_count=F('followers_count') + 1)
+        return added
+
+    def remove_author(self, user, author_id):
+        with transaction.atomic(savepoint=False):
+            removed, _ = self.filter(user=user, author=author_id).delete()
+            if removed:
+                User.objects.filter(
+                    pk=author_id, followers_count__gt=0).update(
+                        followers_count=F('followers_count') - 1)
+        return bool(removed)
+
+    def add_authors(self, user, author_ids):
+        with transaction.atomic(savepoint=False):
+            self.bulk_create(
+                [self.model(user=user, author_id=pk) for pk in author_ids],
+                ignore_conflicts=True)
+            self.recount(author_ids)
+
+    def remove_authors(self, user, author_ids):
+        with transaction.atomic(savepoint=False):
+            self.filter(user=user, author__in=author_ids).delete()
+            self.recount(author_ids)
+
+    def recount(self, author_ids):
+        User.objects.filter(pk__in=author_ids).update(
+            followers_count=count_of(self.model, 'author'))
+
+
 class Follow(models.Model):
     """Модель подписок"""
     user = models.ForeignKey(
@@ -27,6 +127,8 @@ class Follow(models.Model):
         verbose_name='Автор'
     )
 
+    objects = FollowQuerySet.as_manager()
+
     class Meta:
         ordering = ('-id',)
         constraints = [
@@ -34,3 +136,18 @@ class Follow(models.Model):
                 fields=['user', 'author'], name='unique_follow'
             )
         ]
+
+    def save(self, *args, **kwargs):
+        adding = self._state.adding
+        with transaction.atomic(savepoint=False):
+            super().save(*args, **kwargs)
+            if adding:
+                User.objects.filter(pk=self.author_id).update(
+                    followers_count=F('followers_count') + 1)
+
+    def delete(self, *args, **kwargs):
+        with transaction.atomic(savepoint=False):
+            User.objects.filter(
+                pk=self.author_id, followers_count__gt=0).update(
+                followers_count=F('followers_count') - 1)
+            return super().delete(*args, **kwargs)